@@ -0,0 +1,191 @@
+""" Benchmark of fuzzy_numerical and fuzzy_rmse across raster sizes, nodata fractions, neighbourhoods and engines
+
+Synthetic rasters are generated locally (smooth random fields, map B being map A plus noise, with contiguous nodata
+regions as in clipped rasters) and the Salzach rasters are interpolated from the bundled CSVs. Every case runs in a
+fresh process, so that its peak resident memory (RSS) is its own. The report is written as a table (*.csv) and as
+JSON (with the versions and the machine), one row per case:
+
+    dataset, rows, cols, nodata_fraction, active_cells, neigh, halving_distance, engine, method, seconds (best of
+    repeats), cells_per_s (grid cells), active_cells_per_s, peak_rss_mb, measure (global measure)
+
+Usage: python benchmark_engines.py [--quick] [--no-salzach] [--output DIR]
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import rasterio as rio
+from scipy import ndimage
+import fuzzycorr.fuzzycomp as fuzz
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# ------------------------INPUT--------------------------------------
+# Synthetic rasters: (rows, cols) and fraction of nodata cells
+sizes = [(100, 100), (500, 500), (2000, 2000)]
+nodata_fractions = [0.0, 0.5, 0.8]
+
+# Neighbourhoods: (neigh, halving_distance)
+neighbourhoods = [(2, 1), (4, 2), (8, 4), (16, 8)]
+
+# Engines and methods, the cell loop only runs on rasters of up to loop_max_cells cells ('levels' is approximate,
+# see the measure column)
+engines = ['loop', 'vectorized', 'ring', 'levels']
+methods = ['numerical', 'rmse']
+loop_max_cells = 100 * 100
+
+# Timing: best of repeats runs of each case
+repeats = 3
+
+# Salzach case (interpolated from the raw data CSVs)
+salzach_dir = Path(__file__).resolve().parents[1] / 'salzach_case' / 'raw_data'
+salzach_files = ['vali_hydro_FT_manual_2013', 'vali_meas_2013']
+attribute = 'dz'
+res = 5
+crs = 'EPSG:5684'
+nodatavalue = -9999
+ulc = (4571800, 5308230)
+lrc = (4575200, 5302100)
+
+report_name = 'benchmark_report'
+# ------------------------------------------------------------------
+
+
+def synthetic_pair(raster_dir, rows, cols, nodata_fraction, seed=0):
+    """ Writes a pair of synthetic rasters: smooth random field A, B = A + noise, with the same contiguous nodata
+    regions
+
+    :return: path of raster A, path of raster B
+    """
+    rng = np.random.default_rng(seed)
+    field = ndimage.gaussian_filter(rng.normal(size=(rows, cols)), sigma=8)
+    array_A = (field / field.std()).astype('float32')
+    array_B = (array_A + rng.normal(scale=0.3, size=(rows, cols))).astype('float32')
+    if nodata_fraction > 0:
+        region = ndimage.gaussian_filter(rng.normal(size=(rows, cols)), sigma=30)
+        nodata = region < np.quantile(region, nodata_fraction)
+        array_A[nodata] = nodatavalue
+        array_B[nodata] = nodatavalue
+
+    paths = []
+    for name, array in (('A', array_A), ('B', array_B)):
+        path = str(raster_dir / 'synthetic_{}x{}_{}_{}.tif'.format(rows, cols, nodata_fraction, name))
+        with rio.open(path, 'w', driver='GTiff', height=rows, width=cols, count=1, dtype='float32', crs=crs,
+                      transform=rio.transform.from_origin(0, 0, res, res), nodata=nodatavalue) as raster:
+            raster.write(array, 1)
+        paths.append(path)
+    return paths
+
+
+def salzach_pair(raster_dir):
+    """ Interpolates the Salzach raw data (CSVs) to rasters, as prepro_salzach.py does (without clipping)
+
+    :return: path of raster A (hydrodynamic model), path of raster B (measurements)
+    """
+    import fuzzycorr.prepro as pp
+
+    paths = []
+    for file in salzach_files:
+        raster_out = str(raster_dir / (file + '_res5.tif'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            map_file = pp.PreProFuzzy(pd.read_csv(str(salzach_dir / (file + '.csv')), skip_blank_lines=True),
+                                      attribute=attribute, crs=crs, nodatavalue=nodatavalue, res=res, ulc=ulc, lrc=lrc)
+            map_file.array2raster(map_file.norm_array(method='linear'), raster_out, save_ascii=False)
+        paths.append(raster_out)
+    return paths
+
+
+def peak_rss_mb():
+    """ Peak resident memory of the current process in MB (None if unknown) """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10  # bytes on macOS, kilobytes on Linux
+
+
+def run_case(case):
+    """ Times one case (run in a fresh process) and returns its row of the report """
+    with tempfile.TemporaryDirectory() as save_dir, contextlib.redirect_stdout(io.StringIO()):
+        comparison = fuzz.FuzzyComparison(case['raster_A'], case['raster_B'], case['neigh'],
+                                          case['halving_distance'], engine=case['engine'])
+        compare = comparison.fuzzy_numerical if case['method'] == 'numerical' else comparison.fuzzy_rmse
+        seconds = []
+        for _ in range(case['repeats']):
+            start = time.perf_counter()
+            measure = compare('benchmark', save_dir, map_of_comparison=False)
+            seconds.append(time.perf_counter() - start)
+    rows, cols = np.shape(comparison.array_A)
+    active = len(comparison.active[0])
+    row = {key: case[key] for key in ('dataset', 'nodata_fraction', 'neigh', 'halving_distance', 'engine', 'method')}
+    row.update(rows=rows, cols=cols, active_cells=active, seconds=min(seconds),
+               cells_per_s=rows * cols / min(seconds), active_cells_per_s=active / min(seconds),
+               peak_rss_mb=peak_rss_mb(), measure=float(measure))
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the fuzzycomp engines')
+    parser.add_argument('--quick', action='store_true', help='smallest raster size and neighbourhood only')
+    parser.add_argument('--no-salzach', action='store_true', help='synthetic rasters only')
+    parser.add_argument('--output', default=str(Path.cwd() / 'results'), help='directory of the report')
+    args = parser.parse_args()
+    Path(args.output).mkdir(exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raster_dir = Path(tmp_dir)
+        datasets = []
+        for rows, cols in sizes[:1] if args.quick else sizes:
+            for nodata_fraction in nodata_fractions:
+                datasets.append(('synthetic', nodata_fraction, synthetic_pair(raster_dir, rows, cols, nodata_fraction)))
+        if not args.no_salzach:
+            datasets.append(('salzach', None, salzach_pair(raster_dir)))
+
+        cases = []
+        for dataset, nodata_fraction, (raster_A, raster_B) in datasets:
+            with rio.open(raster_A) as src:
+                cells = src.height * src.width
+            for neigh, halving_distance in neighbourhoods[:1] if args.quick else neighbourhoods:
+                for engine in engines:
+                    if engine == 'loop' and cells > loop_max_cells:
+                        continue
+                    for method in methods:
+                        cases.append(dict(dataset=dataset, nodata_fraction=nodata_fraction, raster_A=raster_A,
+                                          raster_B=raster_B, neigh=neigh, halving_distance=halving_distance,
+                                          engine=engine, method=method, repeats=repeats))
+
+        # One fresh process per case, so that the peak memory is the one of the case
+        report = []
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            for case in cases:
+                row = pool.apply(run_case, (case,))
+                report.append(row)
+                print('{dataset} {rows}x{cols} nodata {nodata_fraction} n{neigh}hd{halving_distance} {engine} '
+                      '{method}: {seconds:.3f} s, {cells_per_s:.0f} cells/s, {peak_rss_mb} MB'.format(**row))
+
+    # Machine-readable report
+    columns = ['dataset', 'rows', 'cols', 'nodata_fraction', 'active_cells', 'neigh', 'halving_distance', 'engine',
+               'method', 'seconds', 'cells_per_s', 'active_cells_per_s', 'peak_rss_mb', 'measure']
+    pd.DataFrame(report, columns=columns).to_csv(str(Path(args.output) / (report_name + '.csv')), index=False)
+    environment = {'python': platform.python_version(), 'numpy': np.__version__, 'rasterio': rio.__version__,
+                   'platform': platform.platform(), 'processor': platform.processor(),
+                   'cpu_count': multiprocessing.cpu_count(), 'repeats': repeats}
+    with open(str(Path(args.output) / (report_name + '.json')), 'w') as file:
+        json.dump({'environment': environment, 'cases': report}, file, indent=1)
+    print('Report saved in', args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,5 @@
 from pathlib import Path
 import fuzzycorr.prepro as pp
-import pandas as pd
 
 
 # ---------------Data Pre-processing---------------------------------
@@ -32,6 +31,7 @@ lrc = (4575200, 5302100)
 current_dir = Path.cwd()
 Path(current_dir / 'shapefiles').mkdir(exist_ok=True)
 Path(current_dir / 'rasters').mkdir(exist_ok=True)
+Path(current_dir / 'points').mkdir(exist_ok=True)
 
 poly_path = str(current_dir / 'shapefiles') + '/' + polyname + '.shp'
 
@@ -41,9 +41,12 @@ for file in list_files:
     # Path management
     path_file = str(current_dir / 'raw_data') + '/' + file + '.csv'
     raster_out = str(current_dir / 'rasters') + '/' + file + '_res5.tif'
+    points_out = str(current_dir / 'points') + '/' + file + '.npz'
 
-    # Instantiate object of class PreProFuzzy
-    map_file = pp.PreProFuzzy(pd.read_csv(path_file, skip_blank_lines=True), attribute=attribute, crs=crs, nodatavalue=nodatavalue, res=res, ulc=ulc, lrc=lrc)
+    # Instantiate object of class PreProFuzzy (the csv is converted once to a binary *.npz file in points, not tracked
+    # by git, loaded on later runs)
+    points_file = pp.convert_points(path_file, points_out, skip_blank_lines=True)
+    map_file = pp.PreProFuzzy.from_points(points_file, attribute=attribute, crs=crs, nodatavalue=nodatavalue, res=res, ulc=ulc, lrc=lrc)
 
     # Normalize points to a grid-ed array
     array_ = map_file.norm_array(method=interpol_method)
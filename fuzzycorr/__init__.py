@@ -1,2 +1,2 @@
-from fuzzycorr import fuzzycomp, prepro, plotter
-__all__ = ['fuzzycomp.py', 'prepro.py', 'plotter.py']
+from fuzzycorr import fuzzycomp, engines, cache, processes, prepro, plotter
+__all__ = ['fuzzycomp.py', 'engines.py', 'cache.py', 'processes.py', 'prepro.py', 'plotter.py']
@@ -0,0 +1,152 @@
+try:
+    import numpy as np
+    import os
+    import json
+    import hashlib
+    from pathlib import Path
+except ModuleNotFoundError as e:
+    print('ModuleNotFoundError: Missing fundamental packages (required: numpy, os, json, hashlib, pathlib).')
+    print(e)
+
+
+# Default bound of the size of a cache directory (bytes)
+CACHE_BYTES = 2 ** 30
+
+# Suffix of the entries, the cache never reads or removes other files of its directory
+ENTRY_SUFFIX = '.fuzzcache.npz'
+
+
+class ResultCache:
+    """ On-disk cache of the results (global measure and map of local measures) of fuzzy comparisons
+
+    An entry is keyed by the fingerprints of both rasters and the settings of the comparison, and is stored as one
+    .npz file (ending with ENTRY_SUFFIX) in cache_dir. Reading an entry marks it as recently used; when the cache
+    exceeds max_bytes (or max_entries) the least recently used entries are removed.
+
+                :param cache_dir: string, directory of the cache (created if missing)
+                :param max_bytes: integer, bound of the total size of the entries, default is CACHE_BYTES (1 GiB)
+                :param max_entries: integer, optional, bound of the number of entries
+                :param content_hash: boolean, if True a raster is identified by the hash of its content, otherwise
+                    (default, faster) by its path, size and modification time
+    """
+
+    def __init__(self, cache_dir, max_bytes=CACHE_BYTES, max_entries=None, content_hash=False):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.content_hash = content_hash
+
+    def fingerprint(self, raster):
+        """ Identifies the content of a raster file
+
+        :param raster: string, path of the raster
+        :return: string, hash of the content or path:size:modification time of the file
+        """
+        raster = Path(raster).resolve()
+        if not self.content_hash:
+            stat = raster.stat()
+            return '{}:{}:{}'.format(raster, stat.st_size, stat.st_mtime_ns)
+        digest = hashlib.blake2b(digest_size=20)
+        with open(raster, 'rb') as file:
+            for chunk in iter(lambda: file.read(2 ** 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def key(self, fingerprints, **settings):
+        """ Key of a comparison
+
+        :param fingerprints: tuple of strings, fingerprints of the rasters (see fingerprint)
+        :param settings: settings of the comparison (ex.: neigh, halving_distance, method, engine)
+        :return: string, hexadecimal key
+        """
+        text = json.dumps({'rasters': list(fingerprints), 'settings': settings}, sort_keys=True, default=str)
+        return hashlib.blake2b(text.encode(), digest_size=20).hexdigest()
+
+    def path(self, key):
+        """ Path of the entry of a key """
+        return self.cache_dir / (key + ENTRY_SUFFIX)
+
+    def entries(self):
+        """ Entries of the cache, from the least to the most recently used
+
+        :return: list of paths
+        """
+        return sorted(self.cache_dir.glob('*' + ENTRY_SUFFIX), key=lambda entry: entry.stat().st_mtime)
+
+    def get(self, key):
+        """ Reads an entry and marks it as recently used
+
+        :param key: string, key of the comparison
+        :return: (global measure, np.array local measures) or None if the entry is not cached
+        """
+        entry = self.path(key)
+        try:
+            with np.load(entry) as data:
+                measure, S_i = data['measure'][()], data['S_i']
+        except FileNotFoundError:
+            return None
+        os.utime(entry)
+        return measure, S_i
+
+    def put(self, key, measure, S_i, rasters=()):
+        """ Stores an entry (written to a temporary file and then renamed, so that readers never see a partial entry)
+        and evicts the least recently used entries beyond the bounds of the cache
+
+        :param key: string, key of the comparison
+        :param measure: float, global measure
+        :param S_i: np.array, local measures
+        :param rasters: tuple of strings, paths of the compared rasters (see invalidate)
+        """
+        entry = self.path(key)
+        part = self.cache_dir / (key + '.part')
+        with open(part, 'wb') as file:
+            np.savez(file, measure=measure, S_i=np.ma.getdata(S_i),
+                     rasters=np.array([str(Path(raster).resolve()) for raster in rasters]))
+        os.replace(part, entry)
+        self.evict()
+
+    def evict(self):
+        """ Removes the least recently used entries until the cache fits max_bytes and max_entries
+        """
+        entries = [(entry, entry.stat().st_size) for entry in self.entries()]
+        size = sum(entry_size for _, entry_size in entries)
+        while entries and (size > self.max_bytes or (self.max_entries is not None and len(entries) > self.max_entries)):
+            entry, entry_size = entries.pop(0)
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+    def invalidate(self, raster=None, key=None):
+        """ Removes the entries of a comparison (key), of every comparison involving a raster, or all of them
+
+        :param raster: string, optional, path of a raster whose comparisons are removed
+        :param key: string, optional, key of the comparison to remove
+        :return: integer, number of removed entries
+        """
+        if key is not None:
+            entries = [self.path(key)] if self.path(key).exists() else []
+        elif raster is not None:
+            raster = str(Path(raster).resolve())
+            entries = []
+            for entry in self.entries():
+                with np.load(entry) as data:
+                    if 'rasters' in data.files and raster in data['rasters']:
+                        entries.append(entry)
+        else:
+            entries = self.entries()
+        for entry in entries:
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
+        return len(entries)
+
+    def clear(self):
+        """ Removes every entry of the cache
+
+        :return: integer, number of removed entries
+        """
+        return self.invalidate()
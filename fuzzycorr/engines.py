@@ -0,0 +1,826 @@
+try:
+    import numpy as np
+    from scipy import ndimage
+except ModuleNotFoundError as e:
+    print('ModuleNotFoundError: Missing fundamental packages (required: numpy, scipy).')
+    print(e)
+
+
+ENGINES = ('loop', 'vectorized', 'ring', 'levels')
+
+# Fraction of the cells above which the ring engine evaluates a ring over the whole raster instead of the open cells
+OPEN_FRACTION = 0.25
+
+# Rows of the strips whose bounding boxes of active cells are compared separately
+ACTIVE_STRIP = 64
+
+# Rounding steps over the range of the values of the maps, which set the default tolerance of the levels engine
+LEVELS = 64
+
+
+def nodata_mask(array, nodatavalue):
+    """ Flags the cells of a raster band without data: the mask of a masked array (read_raster), or the cells holding
+    the nodatavalue (nan included) of a plain array (read_raster_mmap)
+
+    :param array: np.ma.array or np.array, raster band
+    :param nodatavalue: float, nodatavalue of the raster
+    :return: np.array of booleans, True where the cell has no data
+    """
+    if np.ma.isMaskedArray(array):
+        return np.ma.getmaskarray(array)
+    if nodatavalue is None:
+        return np.zeros(np.shape(array), dtype=bool)
+    if np.isnan(nodatavalue):
+        return np.isnan(array)
+    return array == nodatavalue
+
+
+def valid_cells(array, nodatavalue):
+    """ Flags the cells of a raster band that take part in the comparison
+
+    :param array: np.ma.array or np.array, raster band as returned by read_raster or read_raster_mmap
+    :param nodatavalue: float, nodatavalue of the raster
+    :return: np.array of booleans, True where the cell is neither masked nor equal to the nodatavalue
+    """
+    valid = ~nodata_mask(array, nodatavalue)
+    if nodatavalue is not None:
+        valid &= np.ma.getdata(array) != nodatavalue
+    return valid
+
+
+class ActiveCells:
+    """ Compact index of the valid cells of a raster band, so that mostly-nodata rasters (e.g. clipped river corridors)
+    are compared over their active cells only
+
+    :param valid: np.array of booleans, valid cells of the raster band
+    :param strip: integer, rows of the strips whose bounding boxes of active cells are precomputed, default is
+        ACTIVE_STRIP
+    """
+
+    def __init__(self, valid, strip=ACTIVE_STRIP):
+        valid = np.asarray(valid, dtype=bool)
+        self.shape = valid.shape
+        # Flat indices of the active cells (row-major) and their start and stop in every row
+        self.flat = np.flatnonzero(valid)
+        rows, cols = np.divmod(self.flat, self.shape[1])
+        self.row_start = np.searchsorted(rows, np.arange(self.shape[0]), side='left')
+        self.row_stop = np.searchsorted(rows, np.arange(self.shape[0]), side='right')
+
+        # Bounding boxes of the active cells of each strip of rows
+        self.boxes = []
+        for row in range(0, self.shape[0], strip):
+            start, stop = self.row_start[row], self.row_stop[min(row + strip, self.shape[0]) - 1]
+            if start < stop:
+                self.boxes.append((slice(int(rows[start]), int(rows[stop - 1]) + 1),
+                                   slice(int(cols[start:stop].min()), int(cols[start:stop].max()) + 1)))
+
+    def __len__(self):
+        return self.flat.size
+
+    def row(self, row):
+        """ Columns of the active cells of one row
+
+        :param row: int, row of the raster
+        :return: np.array (int) columns of its active cells
+        """
+        return self.flat[self.row_start[row]:self.row_stop[row]] - row * self.shape[1]
+
+    def cells(self):
+        """ Iterates over the active cells in row-major order
+
+        :return: generator of tuples (row, col)
+        """
+        for row in np.flatnonzero(self.row_stop > self.row_start):
+            for col in self.row(row):
+                yield int(row), int(col)
+
+
+def active_cells(array_A, array_B, neigh=0, nodatavalue=None):
+    """ Active-cell indices of the central (non-masked) cells of a pair of raster bands
+
+    :param array_A: np.ma.array or np.array, raster band (or block) of map A
+    :param array_B: np.ma.array or np.array, raster band (or block) of map B
+    :param neigh: integer, halo of the blocks (cells around the central cells), default is 0
+    :param nodatavalue: float, nodatavalue of plain arrays (see nodata_mask), default is None
+    :return: tuple of ActiveCells, for A and B
+    """
+    inner = (slice(neigh, -neigh or None),) * 2
+    return tuple(ActiveCells(~nodata_mask(array[inner], nodatavalue)) for array in (array_A, array_B))
+
+
+def affected_boxes(changed, neigh):
+    """ Bounding boxes of the cells whose measures depend on a set of changed cells: the cells within neigh cells of
+    a change, grouped in connected regions
+
+    :param changed: np.array of booleans, changed cells of a raster band
+    :param neigh: integer, neighborhood being considered (number of cells from the central cell)
+    :return: list of tuples (slice of rows, slice of columns)
+    """
+    affected = ndimage.maximum_filter(np.asarray(changed, dtype=bool), size=2 * neigh + 1, mode='constant',
+                                      cval=False)
+    labels, _ = ndimage.label(affected, structure=np.ones((3, 3)))
+    return [box for box in ndimage.find_objects(labels) if box is not None]
+
+
+DECAY_FUNCTIONS = {
+    'exponential': lambda d, halving_distance: 2 ** (-d / halving_distance),
+    'linear': lambda d, halving_distance: np.maximum(1 - d / (2 * halving_distance), 0),
+}
+
+_KERNELS = {}
+
+
+class MembershipKernel:
+    """ Membership of every cell of a full (2n+1)x(2n+1) neighbourhood to its central cell
+
+    The kernel is computed once, border cells get a sliced view of it (see window). Use get_kernel to obtain a
+    cached instance instead of creating a new one.
+
+    :param neigh: integer, neighborhood being considered (number of cells from the central cell)
+    :param halving_distance: integer, distance (in cells) to which the membership decays to its half
+    :param decay: string, name of the distance decay function in DECAY_FUNCTIONS, default is 'exponential'
+    """
+
+    def __init__(self, neigh, halving_distance, decay='exponential'):
+        if decay not in DECAY_FUNCTIONS:
+            raise ValueError('Unknown decay function ' + str(decay) + ', choose one of ' + str(list(DECAY_FUNCTIONS)))
+        self.neigh = neigh
+        self.halving_distance = halving_distance
+        self.decay = decay
+
+        # Distance (in cells) of all neighbours to the central cell
+        size = 2 * neigh + 1
+        i, j = np.indices((size, size))
+        i = i.flatten() - neigh
+        j = j.flatten() - neigh
+        self.distance = np.reshape((i ** 2 + j ** 2) ** 0.5, (size, size))
+        self.weights = DECAY_FUNCTIONS[decay](self.distance, halving_distance)
+        self.distance.flags.writeable = False
+        self.weights.flags.writeable = False
+
+    def window(self, x, y, shape):
+        """ Membership of the neighbours of cell x, y, clipped at the edges of the raster
+
+        :param x: int, cell in x
+        :param y: int, cell in y
+        :param shape: tuple, shape of the raster
+        :return: np.array (float), read-only view of the kernel
+        """
+        n = self.neigh
+        return self.weights[max(n - x, 0): n + min(shape[0] - x, n + 1),
+                            max(n - y, 0): n + min(shape[1] - y, n + 1)]
+
+    def membership(self, di, dj):
+        """ Membership of the neighbour at offset di, dj of the central cell """
+        return self.weights[self.neigh + di, self.neigh + dj]
+
+
+def get_kernel(neigh, halving_distance, decay='exponential'):
+    """ Returns the cached MembershipKernel of a neighbourhood, halving distance and decay function
+
+    :param neigh: integer, neighborhood being considered (number of cells from the central cell)
+    :param halving_distance: integer, distance (in cells) to which the membership decays to its half
+    :param decay: string, name of the distance decay function in DECAY_FUNCTIONS
+    :return: MembershipKernel
+    """
+    key = (neigh, halving_distance, decay)
+    if key not in _KERNELS:
+        _KERNELS[key] = MembershipKernel(neigh, halving_distance, decay)
+    return _KERNELS[key]
+
+
+def shifted_neighbours(array, valid, neigh, halo=False):
+    """ Iterates over the kernel offsets, yielding the neighbour of every cell as a whole shifted array
+
+    The array is padded with ``neigh`` invalid cells on each side (unless it already carries a halo of ``neigh`` cells),
+    so that the neighbour at offset (di, dj) of cell (x, y) is found at the same position (x, y) of the shifted array.
+    A stack of bands (rows and columns on the last two axes) is shifted band by band in the same pass.
+
+    :param array: np.array, raster band (or stack of bands) holding the neighbours
+    :param valid: np.array of booleans, valid cells of the raster band
+    :param neigh: integer, neighborhood being considered (number of cells from the central cell)
+    :param halo: boolean, True if array and valid already include a halo of neigh cells around the central cells
+    :return: generator of tuples (di, dj, shifted values, shifted validity)
+    """
+    if halo:
+        padded, padded_valid = np.ma.getdata(array), valid
+    else:
+        pad = ((0, 0),) * (np.ndim(array) - 2) + ((neigh, neigh), (neigh, neigh))
+        padded = np.pad(np.ma.getdata(array), pad, mode='constant')
+        padded_valid = np.pad(valid, pad, mode='constant', constant_values=False)
+    rows, cols = padded.shape[-2] - 2 * neigh, padded.shape[-1] - 2 * neigh
+    for di in range(-neigh, neigh + 1):
+        for dj in range(-neigh, neigh + 1):
+            window = (Ellipsis, slice(neigh + di, neigh + di + rows), slice(neigh + dj, neigh + dj + cols))
+            yield di, dj, padded[window], padded_valid[window]
+
+
+def shift_reduce(array_central, array_neigh, valid_central, valid_neigh, kernel, method='numerical', halo=False,
+                 dtype=float):
+    """ One-way fuzzy measure computed one kernel offset at a time over the whole raster
+
+    For method 'numerical' each cell takes the maximum of the membership-weighted similarities (not propagating nan)
+    over its valid neighbours, as FuzzyComparison.neighbours and f_similarity do cell by cell. For method 'rmse' each
+    cell takes the minimum of the squared errors divided by the membership, as squared_error does cell by cell
+    (nan errors and offsets with zero membership are left out, as np.ma.divide masks them, see unmeasured).
+
+    :param array_central: np.array, raster band whose cells are under analysis (map A in A x B)
+    :param array_neigh: np.array, raster band providing the neighbours (map B in A x B)
+    :param valid_central: np.array of booleans, valid cells of array_central
+    :param valid_neigh: np.array of booleans, valid cells of array_neigh
+    :param kernel: MembershipKernel, membership of the neighbourhood
+    :param method: string, 'numerical' or 'rmse'
+    :param halo: boolean, True if array_neigh and valid_neigh include a halo of kernel.neigh cells around array_central
+    :param dtype: data type in which the measures are computed, default is float
+    :return: np.array (dtype) best measure of each cell, np.array (bool) True where a valid neighbour exists
+    """
+    return sweep_reduce(array_central, array_neigh, valid_central, valid_neigh, [kernel], method, halo, dtype=dtype)[0]
+
+
+def offset_measure(neighbours, central, valid, method, dtype=float):
+    """ Measure between every central cell and its neighbour at one kernel offset, before the membership
+
+    :param neighbours: np.array, neighbour of every central cell at the offset
+    :param central: np.array, central cells
+    :param valid: np.array of booleans, True where the neighbour is valid
+    :param method: string, 'numerical' (similarity, nan where not valid) or 'rmse' (squared error, inf where not valid)
+    :param dtype: data type of the measure, default is float
+    :return: np.array (dtype)
+    """
+    difference = np.subtract(neighbours, central)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if method == 'numerical':
+            # 1 - |e - c| / max(|e|, |c|), with the temporaries reused in place
+            scale = np.abs(neighbours)
+            np.maximum(scale, np.abs(central), out=scale)
+            np.abs(difference, out=difference)
+            measure = np.divide(difference, scale, out=difference if difference.dtype.kind == 'f' else None)
+            np.subtract(1, measure, out=measure)
+            measure = measure.astype(dtype, copy=False)
+            measure[~valid] = np.nan
+        else:
+            # squared in float, as np.ma.power does for the masked neighbours of the cell loop
+            measure = difference.astype(dtype, copy=False)
+            np.square(measure, out=measure)
+            measure[~valid] = np.inf
+    return measure
+
+
+def reduce_measure(best, measure, memb, method):
+    """ Updates in place the best measure with the measure of one offset weighted by its membership
+
+    :param best: np.array (float), running best measure
+    :param measure: np.array (float), measure of the offset (see offset_measure), same data type as best
+    :param memb: float, membership of the offset
+    :param method: string, 'numerical' or 'rmse'
+    :return: boolean, False if the offset does not take part in the measure (zero membership in fuzzy rmse)
+    """
+    memb = best.dtype.type(memb)  # a float64 membership would promote the products of float32 measures
+    if method == 'numerical':
+        np.fmax(best, measure * memb, out=best)  # running max without propagating nan
+    elif memb > 0:
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            np.fmin(best, measure / memb, out=best)  # running min without the nan errors, as np.ma.divide masks them
+    else:
+        return False
+    return True
+
+
+def sweep_reduce(array_central, array_neigh, valid_central, valid_neigh, kernels, method='numerical', halo=False,
+                 offsets=None, dtype=float):
+    """ One-way fuzzy measure of several kernels in a single pass: the measure of each offset is computed once and
+    reduced under every kernel reaching it (see shift_reduce)
+
+    :param array_central: np.array, raster band whose cells are under analysis (map A in A x B)
+    :param array_neigh: np.array, raster band providing the neighbours (map B in A x B)
+    :param valid_central: np.array of booleans, valid cells of array_central
+    :param valid_neigh: np.array of booleans, valid cells of array_neigh
+    :param kernels: list of MembershipKernel
+    :param method: string, 'numerical' or 'rmse'
+    :param halo: boolean, True if array_neigh and valid_neigh include a halo of max(kernel.neigh) cells around
+        array_central
+    :param offsets: set of tuples (di, dj), optional, only these offsets are evaluated (default is all)
+    :param dtype: data type in which the measures are computed, default is float
+    :return: list of tuples (np.array (dtype) best measure of each cell, np.array (bool) True where a valid neighbour
+        exists), one for each kernel
+    """
+    central = np.ma.getdata(array_central)
+    neigh = max(kernel.neigh for kernel in kernels)
+    found = [np.zeros(np.shape(central), dtype=bool) for _ in kernels]
+    if method == 'numerical':
+        best = [np.full(np.shape(central), np.nan, dtype=dtype) for _ in kernels]
+    elif method == 'rmse':
+        best = [np.full(np.shape(central), np.inf, dtype=dtype) for _ in kernels]
+    else:
+        raise ValueError('Unknown method ' + str(method) + ", choose 'numerical' or 'rmse'")
+
+    for di, dj, neighbours, valid in shifted_neighbours(array_neigh, valid_neigh, neigh, halo):
+        if offsets is not None and (di, dj) not in offsets:
+            continue
+        measure = offset_measure(neighbours, central, valid, method, dtype)
+        for k, kernel in enumerate(kernels):
+            if max(abs(di), abs(dj)) <= kernel.neigh:
+                reduce_measure(best[k], measure, kernel.membership(di, dj), method)
+                found[k] |= valid
+
+    for k in range(len(kernels)):
+        found[k] &= valid_central
+        unmeasured(best[k], found[k], method)
+    return list(zip(best, found))
+
+
+def unmeasured(best, found, method):
+    """ Sets to nan, in place, the fuzzy rmse of the cells whose valid neighbours all gave a non-finite error (nan
+    values, overflow or zero membership), which the cell loop masks with np.ma.divide before taking np.amin
+
+    :param best: np.array (float), best measure of each cell
+    :param found: np.array (bool), True where a valid neighbour exists
+    :param method: string, 'numerical' or 'rmse'
+    """
+    if method == 'rmse':
+        best[found & np.isinf(best)] = np.nan
+
+
+def window_gap(padded, padded_valid, central, neigh, dtype=float):
+    """ Lower bound of the distance between every central value and the values of the valid neighbours of its window,
+    used to bound the squared errors of fuzzy rmse
+
+    :param padded: np.array, raster band providing the neighbours, with a halo of neigh cells around the central cells
+    :param padded_valid: np.array of booleans, valid cells of padded
+    :param central: np.array, central cells
+    :param neigh: integer, neighborhood being considered (number of cells from the central cell)
+    :param dtype: data type of the distance, default is float
+    :return: np.array (dtype) distance from the central value to the range of the window (inf without valid
+        neighbours), np.array (bool) True where the window holds nan values (no bound)
+    """
+    window = (slice(neigh, padded.shape[0] - neigh), slice(neigh, padded.shape[1] - neigh))
+    # min and max are exact, so the window is scanned in the data type of the band (float for integers)
+    values = padded if np.issubdtype(padded.dtype, np.floating) else padded.astype(float)
+    low = ndimage.minimum_filter(np.where(padded_valid, values, np.inf), size=2 * neigh + 1, mode='constant',
+                                 cval=np.inf)[window]
+    high = ndimage.maximum_filter(np.where(padded_valid, values, -np.inf), size=2 * neigh + 1, mode='constant',
+                                  cval=-np.inf)[window]
+    has_nan = ndimage.maximum_filter(padded_valid & np.isnan(values), size=2 * neigh + 1, mode='constant',
+                                     cval=False)[window]
+    with np.errstate(invalid='ignore', over='ignore'):
+        gap = np.maximum(np.maximum(low - central, central - high), 0)
+    return gap.astype(dtype, copy=False), has_nan
+
+
+def ring_reduce(array_central, array_neigh, valid_central, valid_neigh, kernel, method='numerical', halo=False,
+                stats=None, dtype=float):
+    """ One-way fuzzy measure evaluated ring by ring (offsets sorted by distance), stopping for each cell as soon as
+    no remaining ring can beat its current best measure. Gives the same result as shift_reduce.
+
+    A ring at distance d contributes at most its membership m(d) to fuzzy numerical (the similarity is at most 1),
+    and at least gap ** 2 / m(d) to fuzzy rmse, where gap is the distance from the central value to the range of the
+    valid neighbours in its window. As the membership decays with the distance, a cell whose best measure reaches that
+    bound is final.
+
+    Gathering the open cells costs several times a shifted pass over the whole raster, so the rings are evaluated over
+    the whole raster (as shift_reduce) while more than OPEN_FRACTION of the valid cells remain open, and over the open
+    cells only afterwards. The bound of fuzzy rmse seldom holds when the values of the window surround the central
+    value (smooth maps), in which case the engine runs as shift_reduce and its cost grows with (2n+1)^2, see
+    levels_reduce for an approximate engine whose cost does not.
+
+    :param array_central: np.array, raster band whose cells are under analysis (map A in A x B)
+    :param array_neigh: np.array, raster band providing the neighbours (map B in A x B)
+    :param valid_central: np.array of booleans, valid cells of array_central
+    :param valid_neigh: np.array of booleans, valid cells of array_neigh
+    :param kernel: MembershipKernel, membership of the neighbourhood
+    :param method: string, 'numerical' or 'rmse'
+    :param halo: boolean, True if array_neigh and valid_neigh include a halo of kernel.neigh cells around array_central
+    :param stats: dict, optional, its counts of 'evaluated' and 'pruned' (cell, offset) pairs are increased
+    :param dtype: data type in which the measures are computed, default is float
+    :return: np.array (dtype) best measure of each cell, np.array (bool) True where a valid neighbour exists
+    """
+    n = kernel.neigh
+    central = np.ma.getdata(array_central)
+    if halo:
+        padded, padded_valid = np.ma.getdata(array_neigh), valid_neigh
+    else:
+        padded = np.pad(np.ma.getdata(array_neigh), n, mode='constant')
+        padded_valid = np.pad(valid_neigh, n, mode='constant', constant_values=False)
+    if method == 'numerical':
+        best = np.full(np.shape(central), np.nan, dtype=dtype)
+    elif method == 'rmse':
+        best = np.full(np.shape(central), np.inf, dtype=dtype)
+        gap, has_nan = window_gap(padded, padded_valid, central, n, dtype)
+    else:
+        raise ValueError('Unknown method ' + str(method) + ", choose 'numerical' or 'rmse'")
+    found = np.zeros(np.shape(central), dtype=bool)
+
+    def final_cells(best, memb, gap=None, has_nan=None):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if method == 'numerical':
+                return best >= memb
+            return (best <= gap ** 2 / memb) & ~has_nan
+
+    # Offsets grouped in rings of equal distance, nearest first
+    rings = {}
+    for di in range(-n, n + 1):
+        for dj in range(-n, n + 1):
+            rings.setdefault(kernel.distance[n + di, n + dj], []).append((di, dj))
+    rings = [rings[d] for d in sorted(rings)]
+    remaining = (2 * n + 1) ** 2
+    n_valid = np.count_nonzero(valid_central)
+    shape = np.shape(central)
+
+    # Whole raster while most cells are open (rows is None), then the open cells kept as compact arrays
+    rows = None
+    evaluated, pruned = 0, 0
+
+    for ring in rings:
+        memb = kernel.membership(*ring[0])
+        # offsets without membership take no part in fuzzy rmse, only their validity is kept (see unmeasured)
+        measured = method == 'numerical' or memb > 0
+
+        if rows is None and measured:
+            open_cells = valid_central & ~final_cells(best, memb, *((gap, has_nan) if method == 'rmse' else ()))
+            if np.count_nonzero(open_cells) <= OPEN_FRACTION * n_valid:
+                rows, cols = np.nonzero(open_cells)
+                pruned += (n_valid - rows.size) * remaining
+                central_open, best_open, found_open = central[rows, cols], best[rows, cols], found[rows, cols]
+                if method == 'rmse':
+                    gap_open, has_nan_open = gap[rows, cols], has_nan[rows, cols]
+        elif rows is not None and measured:
+            final = final_cells(best_open, memb, *((gap_open, has_nan_open) if method == 'rmse' else ()))
+            if final.any():
+                best[rows[final], cols[final]] = best_open[final]
+                found[rows[final], cols[final]] = found_open[final]
+                pruned += np.count_nonzero(final) * remaining
+                keep = ~final
+                rows, cols = rows[keep], cols[keep]
+                central_open, best_open, found_open = central_open[keep], best_open[keep], found_open[keep]
+                if method == 'rmse':
+                    gap_open, has_nan_open = gap_open[keep], has_nan_open[keep]
+        if rows is not None and not rows.size:
+            break
+
+        for di, dj in ring:
+            if rows is None:
+                window = (slice(n + di, n + di + shape[0]), slice(n + dj, n + dj + shape[1]))
+                valid = padded_valid[window]
+                if measured:
+                    reduce_measure(best, offset_measure(padded[window], central, valid, method, dtype), memb, method)
+                found |= valid
+            else:
+                valid = padded_valid[rows + n + di, cols + n + dj]
+                if measured:
+                    neighbours = padded[rows + n + di, cols + n + dj]
+                    reduce_measure(best_open, offset_measure(neighbours, central_open, valid, method, dtype), memb,
+                                   method)
+                found_open |= valid
+        evaluated += (n_valid if rows is None else rows.size) * len(ring)
+        remaining -= len(ring)
+
+    if rows is not None:
+        best[rows, cols] = best_open
+        found[rows, cols] = found_open
+    found &= valid_central
+    unmeasured(best, found, method)
+    if stats is not None:
+        stats['evaluated'] = stats.get('evaluated', 0) + evaluated
+        stats['pruned'] = stats.get('pruned', 0) + pruned
+    return best, found
+
+
+def level_step(array_A, array_B, nodatavalue=None, levels=LEVELS):
+    """ Default tolerance of the levels engine: the largest range of the valid values of both bands divided by levels
+
+    :param array_A: np.ma.array or np.array (see nodata_mask), raster band of map A
+    :param array_B: np.ma.array or np.array, raster band of map B
+    :param nodatavalue: float, nodatavalue of plain arrays, default is None
+    :param levels: integer, number of rounding steps over the range, default is LEVELS
+    :return: float, rounding step (1 for maps holding no valid value other than zero)
+    """
+    step = 0.
+    for array in (array_A, array_B):
+        values = np.ma.getdata(array)[valid_cells(array, nodatavalue)]
+        values = values[np.isfinite(values)]
+        if values.size:
+            low, high = float(values.min()), float(values.max())
+            # a constant band keeps its value as a single multiple of the step
+            step = max(step, (high - low) / levels if high > low else abs(high))
+    return step or 1.
+
+
+def levels_reduce(array_central, array_neigh, valid_central, valid_neigh, kernel, method='numerical', halo=False,
+                  tolerance=1., dtype=float):
+    """ Approximate one-way fuzzy measure whose cost does not depend on the size of the neighbourhood: the neighbour
+    values are rounded to the nearest multiple of tolerance (moving them by at most tolerance / 2, the central values
+    are kept), and the result is the one shift_reduce gives for the rounded neighbours.
+
+    The neighbours holding the same rounded value only differ in their membership, so the best of them is the nearest
+    one, found for every cell at once with a distance transform. The cost is one distance transform per rounded value
+    (about the cost of ten offsets of shift_reduce), instead of one pass per offset of the (2n+1)x(2n+1) kernel.
+    Two cases are scanned offset by offset over the cells they concern: a nearest neighbour out of the square window
+    while a farther one (still within the window) might beat the best measure, and fuzzy numerical cells whose
+    neighbours all have the opposite sign (a negative similarity is best at the farthest neighbour, not the nearest).
+
+    :param array_central: np.array, raster band whose cells are under analysis (map A in A x B)
+    :param array_neigh: np.array, raster band providing the neighbours (map B in A x B)
+    :param valid_central: np.array of booleans, valid cells of array_central
+    :param valid_neigh: np.array of booleans, valid cells of array_neigh
+    :param kernel: MembershipKernel, membership of the neighbourhood
+    :param method: string, 'numerical' or 'rmse'
+    :param halo: boolean, True if array_neigh and valid_neigh include a halo of kernel.neigh cells around array_central
+    :param tolerance: float, rounding step of the neighbour values (see level_step), default is 1
+    :param dtype: data type in which the measures are computed, default is float
+    :return: np.array (dtype) best measure of each cell, np.array (bool) True where a valid neighbour exists
+    """
+    n = kernel.neigh
+    central = np.ma.getdata(array_central)
+    shape = np.shape(central)
+    if halo:
+        padded, padded_valid = np.ma.getdata(array_neigh), valid_neigh
+    else:
+        padded = np.pad(np.ma.getdata(array_neigh), n, mode='constant')
+        padded_valid = np.pad(valid_neigh, n, mode='constant', constant_values=False)
+    if method == 'numerical':
+        best = np.full(shape, np.nan, dtype=dtype)
+        bound = np.full(shape, np.nan, dtype=dtype)
+    elif method == 'rmse':
+        best = np.full(shape, np.inf, dtype=dtype)
+        bound = np.full(shape, np.inf, dtype=dtype)
+    else:
+        raise ValueError('Unknown method ' + str(method) + ", choose 'numerical' or 'rmse'")
+
+    window = (slice(n, n + shape[0]), slice(n, n + shape[1]))
+    found = ndimage.maximum_filter(padded_valid, size=2 * n + 1, mode='constant', cval=False)[window] & valid_central
+    # the rounded neighbours keep the data type of the band (float for integers), as in the other engines
+    values = padded if np.issubdtype(padded.dtype, np.floating) else padded.astype(float)
+    with np.errstate(invalid='ignore', over='ignore'):
+        level = np.round(values.astype(float) / tolerance)
+        rounded = (level * tolerance).astype(values.dtype)
+    levelled = padded_valid & np.isfinite(level)
+    rows, cols = np.indices(shape)
+    rows += n
+    cols += n
+    everywhere = np.ones(shape, dtype=bool)
+
+    for value in np.unique(level[levelled]):
+        distance, (near_row, near_col) = ndimage.distance_transform_edt(~(levelled & (level == value)),
+                                                                        return_indices=True)
+        distance, di, dj = distance[window], near_row[window] - rows, near_col[window] - cols
+        inside = (np.abs(di) <= n) & (np.abs(dj) <= n)
+        # a nearest neighbour out of the window may hide a farther one within it (up to n * sqrt(2) away)
+        outside = ~inside & (distance <= n * 2 ** 0.5)
+        memb = kernel.weights[np.clip(di + n, 0, 2 * n), np.clip(dj + n, 0, 2 * n)].astype(dtype)
+        reach = DECAY_FUNCTIONS[kernel.decay](distance, kernel.halving_distance).astype(dtype)
+        measure = offset_measure(np.full(shape, value * tolerance, dtype=values.dtype), central, everywhere, method,
+                                 dtype)
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            if method == 'numerical':
+                measure[measure < 0] = np.nan
+                np.fmax(best, np.where(inside, measure * memb, np.nan), out=best)
+                np.fmax(bound, np.where(outside, measure * reach, np.nan), out=bound)
+            else:
+                np.fmin(best, np.where(inside & (memb > 0), measure / memb, np.inf), out=best)
+                np.fmin(bound, np.where(outside, measure / reach, np.inf), out=bound)
+
+    if method == 'numerical':
+        rescan = found & (~(best >= 0) | (bound > best))
+    else:
+        rescan = found & (bound < best)
+    rows, cols = np.nonzero(rescan)
+    if rows.size:
+        best[rows, cols] = sweep_cells(rounded, padded_valid, central[rows, cols], rows + n, cols + n, kernel,
+                                       method, dtype)
+    unmeasured(best, found, method)
+    return best, found
+
+
+def sweep_cells(padded, padded_valid, central, rows, cols, kernel, method, dtype=float):
+    """ One-way fuzzy measure of a set of cells, evaluated offset by offset (see shift_reduce)
+
+    :param padded: np.array, raster band providing the neighbours, with a halo of kernel.neigh cells
+    :param padded_valid: np.array of booleans, valid cells of padded
+    :param central: np.array, values of the cells
+    :param rows: np.array (int), rows of the cells in padded
+    :param cols: np.array (int), columns of the cells in padded
+    :param kernel: MembershipKernel, membership of the neighbourhood
+    :param method: string, 'numerical' or 'rmse'
+    :param dtype: data type in which the measures are computed, default is float
+    :return: np.array (dtype) best measure of each cell (before unmeasured)
+    """
+    n = kernel.neigh
+    best = np.full(np.shape(central), np.nan if method == 'numerical' else np.inf, dtype=dtype)
+    for di in range(-n, n + 1):
+        for dj in range(-n, n + 1):
+            valid = padded_valid[rows + di, cols + dj]
+            reduce_measure(best, offset_measure(padded[rows + di, cols + dj], central, valid, method, dtype),
+                           kernel.membership(di, dj), method)
+    return best
+
+
+def two_way(array_A, array_B, kernel, method, nodatavalue, dtype, halo=False, engine='vectorized', stats=None,
+            active=None, progress=None, work_dtype=float, tolerance=None):
+    """ Two-way local measures of a pair of raster bands (or blocks of them), first A x B then B x A
+
+    :param array_A: np.ma.array or np.array (see nodata_mask), raster band (or block) of map A
+    :param array_B: np.ma.array or np.array, raster band (or block) of map B, same shape as array_A
+    :param kernel: MembershipKernel, membership of the neighbourhood
+    :param method: string, 'numerical' or 'rmse'
+    :param nodatavalue: float, value given to cells without a measure
+    :param dtype: data type of the local measures
+    :param halo: boolean, True if the blocks include a halo of kernel.neigh cells, which gets no measure of its own
+    :param engine: string, 'vectorized' (shift_reduce), 'ring' (ring_reduce) or 'levels' (levels_reduce)
+    :param stats: dict, optional, counts of evaluated and pruned (cell, offset) pairs of the 'ring' engine
+    :param active: tuple of ActiveCells, optional, active cells of A and B (of the central cells if halo); only their
+        bounding boxes are computed
+    :param progress: callable, optional, called as progress(phase, done, total) when each pass ('A x B', 'B x A')
+        starts (done is 0), after each bounding box and when it ends (done is total)
+    :param work_dtype: data type in which the measures are computed, default is float (float32 halves the memory of
+        the running measures)
+    :param tolerance: float, optional, rounding step of the neighbour values of the 'levels' engine, default is
+        level_step of the bands
+    :return: np.array local measures of A x B, np.array local measures of B x A
+    """
+    if engine == 'levels':
+        if tolerance is None:
+            tolerance = level_step(array_A, array_B, nodatavalue)
+
+        def one_way(central, array_neigh, valid_central, valid_neigh, halo):
+            return [levels_reduce(central, array_neigh, valid_central, valid_neigh, kernel, method, halo, tolerance,
+                                  work_dtype)]
+    elif engine == 'ring':
+        def one_way(central, array_neigh, valid_central, valid_neigh, halo):
+            return [ring_reduce(central, array_neigh, valid_central, valid_neigh, kernel, method, halo, stats,
+                                work_dtype)]
+    else:
+        def one_way(central, array_neigh, valid_central, valid_neigh, halo):
+            return [shift_reduce(central, array_neigh, valid_central, valid_neigh, kernel, method, halo, work_dtype)]
+    return _two_way(array_A, array_B, kernel.neigh, nodatavalue, dtype, halo, one_way, active, progress)[0]
+
+
+def sweep_two_way(array_A, array_B, kernels, method, nodatavalue, dtype, halo=False, active=None, progress=None,
+                  work_dtype=float):
+    """ Two-way local measures of a pair of raster bands (or blocks of them) for several kernels in a single pass.
+    The bands may also be stacks of bands of the same shape (rows and columns on the last two axes, without active),
+    compared band by band in the same pass.
+
+    :param array_A: np.ma.array or np.array (see nodata_mask), raster band (or block) of map A
+    :param array_B: np.ma.array or np.array, raster band (or block) of map B, same shape as array_A
+    :param kernels: list of MembershipKernel
+    :param method: string, 'numerical' or 'rmse'
+    :param nodatavalue: float, value given to cells without a measure
+    :param dtype: data type of the local measures
+    :param halo: boolean, True if the blocks include a halo of max(kernel.neigh) cells, which gets no measure of its own
+    :param active: tuple of ActiveCells, optional, active cells of A and B (see two_way)
+    :param progress: callable, optional, progress of the passes (see two_way)
+    :param work_dtype: data type in which the measures are computed (see two_way)
+    :return: list of tuples (np.array local measures of A x B, np.array local measures of B x A), one for each kernel
+    """
+    def one_way(central, array_neigh, valid_central, valid_neigh, halo):
+        return sweep_reduce(central, array_neigh, valid_central, valid_neigh, kernels, method, halo, dtype=work_dtype)
+    return _two_way(array_A, array_B, max(kernel.neigh for kernel in kernels), nodatavalue, dtype, halo, one_way,
+                    active, progress)
+
+
+def _two_way(array_A, array_B, neigh, nodatavalue, dtype, halo, one_way, active=None, progress=None):
+    """ Runs a one-way engine first A x B then B x A and fills the local measures """
+    inner = (Ellipsis,) + ((slice(neigh, -neigh or None),) * 2 if halo else (slice(None),) * 2)
+    valid_A = valid_cells(array_A, nodatavalue)
+    valid_B = valid_cells(array_B, nodatavalue)
+    central_A = array_A[inner]
+    central_B = array_B[inner]
+    active_A, active_B = active if active is not None else (None, None)
+
+    measures = []
+    for phase, central, array_neigh, valid_neigh, active_central in (('A x B', central_A, array_B, valid_B, active_A),
+                                                                     ('B x A', central_B, array_A, valid_A, active_B)):
+        valid_central = ~nodata_mask(central, nodatavalue)
+        report = (lambda done, total, phase=phase: progress(phase, done, total)) if progress else None
+        if active_central is None or not active_central.boxes:
+            if report:
+                report(0, 1)
+            results = one_way(central, array_neigh, valid_central, valid_neigh, halo)
+            if report:
+                report(1, 1)
+        else:
+            results = _active_one_way(central, array_neigh, valid_central, valid_neigh, neigh, halo, one_way,
+                                      active_central, report)
+        one_way_measures = []
+        for best, found in results:
+            s = np.full(np.shape(central_A), nodatavalue, dtype=dtype)
+            s[found] = best[found]
+            one_way_measures.append(s)
+        measures.append(one_way_measures)
+    return list(zip(*measures))
+
+
+def _active_one_way(central, array_neigh, valid_central, valid_neigh, neigh, halo, one_way, active, report=None):
+    """ Runs a one-way engine over the bounding boxes of the active cells only, each with a halo of neigh cells """
+    if not active.boxes:
+        return one_way(central, array_neigh, valid_central, valid_neigh, halo)
+
+    results = None
+    if report:
+        report(0, len(active.boxes))
+    for done, (rows, cols) in enumerate(active.boxes, 1):
+        if halo:
+            halo_box = (slice(rows.start, rows.stop + 2 * neigh), slice(cols.start, cols.stop + 2 * neigh))
+            box_neigh, box_valid = array_neigh[halo_box], valid_neigh[halo_box]
+        else:
+            # Only the box and its halo are copied (and read, if the band is memory-mapped)
+            height, width = np.shape(array_neigh)
+            row_start, row_stop = max(rows.start - neigh, 0), min(rows.stop + neigh, height)
+            col_start, col_stop = max(cols.start - neigh, 0), min(cols.stop + neigh, width)
+            pad = ((row_start - (rows.start - neigh), rows.stop + neigh - row_stop),
+                   (col_start - (cols.start - neigh), cols.stop + neigh - col_stop))
+            box_neigh = np.pad(np.ma.getdata(array_neigh)[row_start:row_stop, col_start:col_stop], pad,
+                               mode='constant')
+            box_valid = np.pad(valid_neigh[row_start:row_stop, col_start:col_stop], pad, mode='constant',
+                               constant_values=False)
+        box_results = one_way(central[rows, cols], box_neigh, valid_central[rows, cols], box_valid, True)
+        if results is None:
+            results = [(np.zeros(np.shape(central), dtype=box_best.dtype), np.zeros(np.shape(central), dtype=bool))
+                       for box_best, _ in box_results]
+        for (best, found), (box_best, box_found) in zip(results, box_results):
+            best[rows, cols] = box_best
+            found[rows, cols] = box_found
+        if report:
+            report(done, len(active.boxes))
+    return results
+
+
+def category_memberships(array, valid, categories, kernel):
+    """ Fuzzy membership of each category in the neighbourhood of every cell (fuzzy kappa)
+
+    The membership of a category is the decayed distance to its nearest occurrence, found with one Euclidean distance
+    transform per category instead of a window scan per cell. Occurrences farther than kernel.neigh cells (a disc of
+    radius neigh) have no membership.
+
+    :param array: np.array, classified raster band
+    :param valid: np.array of booleans, valid cells of the raster band
+    :param categories: np.array, sorted categories of the comparison
+    :param kernel: MembershipKernel, neighbourhood, halving distance and decay function
+    :return: list of np.array (float), membership of each category
+    """
+    decay = DECAY_FUNCTIONS[kernel.decay]
+    memberships = []
+    for category in categories:
+        occurrence = valid & (np.ma.getdata(array) == category)
+        if not occurrence.any():
+            memberships.append(np.zeros(np.shape(array)))
+            continue
+        distance = ndimage.distance_transform_edt(~occurrence)
+        memb = decay(distance, kernel.halving_distance)
+        memb[distance > kernel.neigh] = 0
+        memberships.append(memb)
+    return memberships
+
+
+def fuzzy_categories(memberships, similarity_matrix):
+    """ Membership of every category of the comparison given the categorical similarity matrix, i.e. for category a
+    the maximum over the categories c of similarity_matrix[a, c] times the membership of c
+
+    :param memberships: list of np.array, membership of each category (see category_memberships)
+    :param similarity_matrix: np.array (k x k), similarity between the categories
+    :return: np.array (float) of shape (k, ...), fuzzy membership of each category
+    """
+    fuzzy = np.zeros((len(memberships),) + np.shape(memberships[0]))
+    for a in range(len(memberships)):
+        for c, memb in enumerate(memberships):
+            if similarity_matrix[a, c] > 0:
+                np.maximum(fuzzy[a], similarity_matrix[a, c] * memb, out=fuzzy[a])
+    return fuzzy
+
+
+def expected_agreement(fuzzy_A, fuzzy_B, index_A, index_B, similarity_matrix, thresholds=1000):
+    """ Expected fuzzy similarity of two maps with the same category frequencies but independent placement
+    (Hagen, 2003), evaluated on a grid of thresholds
+
+    For a cell of category a in A and b in B, the similarity is min(max(M[a, b], X_a), max(M[b, a], Y_b)), where X_a
+    is the membership of a in the neighbourhood in B and Y_b the membership of b in the neighbourhood in A. X_a is
+    distributed as over the cells of category b in B, Y_b as over the cells of category a in A, and with both
+    independent the expected value is the integral from 0 to 1 of P(max(M[a, b], X_a) > t) P(max(M[b, a], Y_b) > t)
+    dt. For crisp memberships (neigh 0) and the identity matrix, E is the chance agreement of Cohen's kappa.
+
+    :param fuzzy_A: np.array (k x cells), fuzzy membership of each category in A at the compared cells
+    :param fuzzy_B: np.array (k x cells), fuzzy membership of each category in B at the compared cells
+    :param index_A: np.array (cells), category (index) of A at the compared cells
+    :param index_B: np.array (cells), category (index) of B at the compared cells
+    :param similarity_matrix: np.array (k x k), similarity between the categories
+    :param thresholds: integer, number of thresholds of the integral
+    :return: float, expected similarity
+    """
+    t = (np.arange(thresholds) + 0.5) / thresholds  # midpoints
+
+    def survival(values):
+        return 1 - np.searchsorted(np.sort(values), t, side='right') / values.size
+
+    k = len(similarity_matrix)
+    p_A = np.bincount(index_A, minlength=k) / index_A.size
+    p_B = np.bincount(index_B, minlength=k) / index_B.size
+    in_A = [index_A == a for a in range(k)]
+    in_B = [index_B == b for b in range(k)]
+
+    expected = 0.0
+    for a in np.nonzero(p_A)[0]:
+        for b in np.nonzero(p_B)[0]:
+            s_X = np.where(t < similarity_matrix[a, b], 1.0, survival(fuzzy_B[a][in_B[b]]))
+            s_Y = np.where(t < similarity_matrix[b, a], 1.0, survival(fuzzy_A[b][in_A[a]]))
+            expected += p_A[a] * p_B[b] * np.mean(s_X * s_Y)
+    return expected
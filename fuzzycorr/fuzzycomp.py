@@ -2,9 +2,21 @@ try:
     import numpy as np
     import rasterio as rio
     import sys
+    import os
+    import tempfile
+    import multiprocessing
+    import itertools
+    import json
+    import time
+    import hashlib
+    import contextlib
+    from datetime import datetime
     from pathlib import Path
+    from fuzzycorr import engines, processes
+    from fuzzycorr.cache import ResultCache
 except ModuleNotFoundError as e:
-    print('ModuleNotFoundError: Missing fundamental packages (required: numpy, gdal, rasterio, pathlib, sys).')
+    print('ModuleNotFoundError: Missing fundamental packages (required: numpy, gdal, rasterio, pathlib, sys, os, '
+          'tempfile, multiprocessing, itertools, json, time, hashlib, contextlib, datetime).')
     print(e)
 
 
@@ -17,6 +29,137 @@ def read_raster(raster):
     return raster_np, nodatavalue, meta, meta['crs'], meta['dtype']
 
 
+def read_raster_mmap(raster, sidecar_dir=None):
+    """ Reads band 1 of a raster as a read-only memory-mapped array instead of a masked array: the cells without data
+    hold the nodatavalue. The band is converted once, block by block, to a .npy sidecar next to the raster (or in
+    sidecar_dir). The sidecar is named after the resolved path of the raster, so that rasters of the same name in
+    different directories do not share it, and carries the modification time of the raster, so that it is written
+    again whenever the raster changes.
+
+    :param raster: string, path of the raster
+    :param sidecar_dir: string, optional, directory of the .npy sidecars, default is the directory of the raster
+    :return: np.memmap of band 1, nodatavalue, meta (dict), crs, dtype
+    """
+    raster = Path(raster).resolve()
+    source = hashlib.blake2b(str(raster).encode(), digest_size=8).hexdigest()
+    sidecar = Path(sidecar_dir or raster.parent) / (raster.name + '.' + source + '.npy')
+    with rio.open(raster) as src:
+        nodatavalue = src.nodata
+        meta = src.meta.copy()
+        mtime = raster.stat().st_mtime_ns
+        if not sidecar.exists() or sidecar.stat().st_mtime_ns != mtime:
+            partial = sidecar.with_name(sidecar.name + '.part')
+            band = np.lib.format.open_memmap(partial, mode='w+', dtype=meta['dtype'], shape=(src.height, src.width))
+            for _, window in src.block_windows(1):
+                band[window.toslices()] = src.read(1, window=window)
+            band.flush()
+            del band
+            os.utime(partial, ns=(mtime, mtime))
+            os.replace(partial, sidecar)
+    raster_np = np.load(sidecar, mmap_mode='r')
+    print('Number of active cells (non-masked) of raster ', str(raster), ': ',
+          raster_np.size - np.count_nonzero(engines.nodata_mask(raster_np, nodatavalue)))
+    return raster_np, nodatavalue, meta, meta['crs'], meta['dtype']
+
+
+def read_stack(raster, variable=None):
+    """ Reads every band of a multi-band raster (ex.: the timesteps of a NetCDF variable), or band 1 of each raster
+    of a list, as a stack of bands
+
+    :param raster: string, path of a (multi-band) raster, or list of strings, paths of single-band rasters of the same
+        shape and coordinate system
+    :param variable: string, optional, variable of a NetCDF file (read with the netCDF driver of gdal)
+    :return: np.ma.array of shape (bands, rows, columns), nodatavalue, meta (dict), crs, dtype, list of band labels
+    """
+    if isinstance(raster, (list, tuple)):
+        bands, labels = [], []
+        for path in raster:
+            with rio.open(path) as src:
+                bands.append(src.read(1, masked=True))
+                if not labels:
+                    nodatavalue, meta = src.nodata, src.meta.copy()
+                elif src.crs != meta['crs'] or src.shape != bands[0].shape:
+                    sys.exit('MapError: ' + str(path) + ' has a different coordinate system or shape than ' +
+                             str(raster[0]))
+            labels.append(Path(str(path)).stem)
+        stack = np.ma.stack(bands)
+    else:
+        path = 'NETCDF:"' + str(raster) + '":' + variable if variable is not None else raster
+        with rio.open(path) as src:
+            stack = src.read(masked=True)
+            nodatavalue, meta = src.nodata, src.meta.copy()
+            labels = [description or 'band ' + str(band + 1) for band, description in enumerate(src.descriptions)]
+    print('Number of active cells (non-masked) of raster ', raster, ': ', np.ma.count(stack), ' in ',
+          len(labels), ' bands')
+    return stack, nodatavalue, meta, meta['crs'], meta['dtype'], labels
+
+
+def read_meta(raster):
+    """ Reads the metadata of a raster without reading its values
+
+    :param raster: string, path of the raster
+    :return: nodatavalue, meta (dict), crs, dtype
+    """
+    with rio.open(raster) as src:
+        nodatavalue = src.nodata
+        meta = src.meta.copy()
+    return nodatavalue, meta, meta['crs'], meta['dtype']
+
+
+def read_block(src, row_off, col_off, height, width, halo):
+    """ Reads a block of band 1 surrounded by a halo of cells, the halo outside of the raster is masked
+
+    :param src: rasterio dataset opened for reading
+    :param row_off: int, first row of the block
+    :param col_off: int, first column of the block
+    :param height: int, number of rows of the block
+    :param width: int, number of columns of the block
+    :param halo: int, number of cells added on each side of the block
+    :return: np.ma.array of shape (height + 2 * halo, width + 2 * halo)
+    """
+    row_start, row_stop = max(row_off - halo, 0), min(row_off + height + halo, src.height)
+    col_start, col_stop = max(col_off - halo, 0), min(col_off + width + halo, src.width)
+    window = rio.windows.Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+    block = src.read(1, window=window, masked=True)
+
+    pad = ((row_start - (row_off - halo), row_off + height + halo - row_stop),
+           (col_start - (col_off - halo), col_off + width + halo - col_stop))
+    return pad_block(np.ma.getdata(block), np.ma.getmaskarray(block), pad)
+
+
+def array_block(array, row_off, col_off, height, width, halo, nodatavalue):
+    """ Takes a block of a raster band in memory surrounded by a halo of cells, as read_block does from the raster
+
+    :param array: np.ma.array or np.array (see engines.nodata_mask), raster band
+    :param row_off: int, first row of the block
+    :param col_off: int, first column of the block
+    :param height: int, number of rows of the block
+    :param width: int, number of columns of the block
+    :param halo: int, number of cells added on each side of the block
+    :param nodatavalue: float, nodatavalue of the raster
+    :return: np.ma.array of shape (height + 2 * halo, width + 2 * halo)
+    """
+    row_start, row_stop = max(row_off - halo, 0), min(row_off + height + halo, np.shape(array)[0])
+    col_start, col_stop = max(col_off - halo, 0), min(col_off + width + halo, np.shape(array)[1])
+    block = array[row_start:row_stop, col_start:col_stop]
+
+    pad = ((row_start - (row_off - halo), row_off + height + halo - row_stop),
+           (col_start - (col_off - halo), col_off + width + halo - col_stop))
+    return pad_block(np.ma.getdata(block), engines.nodata_mask(block, nodatavalue), pad)
+
+
+def pad_block(data, mask, pad):
+    """ Pads a block with masked cells
+
+    :param data: np.array, values of the block
+    :param mask: np.array of booleans, mask of the block
+    :param pad: tuple ((before, after), (before, after)), number of cells to add to the rows and the columns
+    :return: np.ma.array
+    """
+    return np.ma.array(np.pad(data, pad, mode='constant'),
+                       mask=np.pad(mask, pad, mode='constant', constant_values=True))
+
+
 def jaccard(a, b):
     """Creates a ...
 
@@ -56,21 +199,317 @@ def squared_error(centrall_cell, neighbours):
     return simil_neigh
 
 
+def local_measures(s_AB, s_BA, method):
+    """ Combines the two-way measures into the local measure: the minimum similarity for fuzzy numerical, the maximum
+    error for fuzzy RMSE
+
+    :param s_AB: np.array, local measures of A x B
+    :param s_BA: np.array, local measures of B x A
+    :param method: string, 'numerical' or 'rmse'
+    :return: np.array, local measures S_i (in the buffer of s_AB)
+    """
+    if method == 'numerical':
+        return np.minimum(s_AB, s_BA, out=s_AB)
+    return np.maximum(s_AB, s_BA, out=s_AB)
+
+
+def _tile_measures(task):
+    """ Local measures of one tile read with its halo from the rasters (run in the worker processes) """
+    (raster_A, raster_B, row_off, col_off, height, width, kernel_key, method, nodatavalue, dtype, engine,
+     work_dtype, tolerance) = task
+    kernel = engines.get_kernel(*kernel_key)
+    with rio.open(raster_A) as src_A, rio.open(raster_B) as src_B:
+        block_A = read_block(src_A, row_off, col_off, height, width, kernel.neigh)
+        block_B = read_block(src_B, row_off, col_off, height, width, kernel.neigh)
+    s_AB, s_BA = engines.two_way(block_A, block_B, kernel, method, nodatavalue, dtype, halo=True, engine=engine,
+                                 active=engines.active_cells(block_A, block_B, kernel.neigh), work_dtype=work_dtype,
+                                 tolerance=tolerance)
+    return local_measures(s_AB, s_BA, method)
+
+
+def _band_measures(task):
+    """ Two-way measures of a band of rows, read from and written to memory-mapped files (run in the worker
+    processes), returns the counts of evaluated and pruned (cell, offset) pairs of the 'ring' engine """
+    files, row_start, row_stop, kernel_key, method, nodatavalue, engine, work_dtype, tolerance = task
+    stats = {}
+    kernel = engines.get_kernel(*kernel_key)
+    n = kernel.neigh
+    s_AB = np.load(files['s_AB'], mmap_mode='r+')
+    s_BA = np.load(files['s_BA'], mmap_mode='r+')
+
+    # Rows of the band and its halo, the halo outside of the raster is masked
+    first, last = max(row_start - n, 0), min(row_stop + n, s_AB.shape[0])
+    pad = ((first - (row_start - n), row_stop + n - last), (n, n))
+    blocks = []
+    for name in ('A', 'B'):
+        data = np.load(files[name], mmap_mode='r')
+        mask = np.load(files['mask_' + name], mmap_mode='r')
+        blocks.append(pad_block(data[first:last], mask[first:last], pad))
+
+    s_AB[row_start:row_stop], s_BA[row_start:row_stop] = engines.two_way(blocks[0], blocks[1], kernel, method,
+                                                                         nodatavalue, s_AB.dtype, halo=True,
+                                                                         engine=engine, stats=stats,
+                                                                         active=engines.active_cells(*blocks, n),
+                                                                         work_dtype=work_dtype, tolerance=tolerance)
+    s_AB.flush()
+    s_BA.flush()
+    return stats
+
+
+def global_measure(S_i, method, nodatavalue):
+    """ Overall measure of the local measures: the mean fuzzy similarity, or the root of the mean squared error
+
+    :param S_i: np.array, local measures
+    :param method: string, 'numerical' or 'rmse'
+    :param nodatavalue: float, value of the cells without a measure
+    :return: global measure, np.ma.array of the local measures masked where there is no measure
+    """
+    # Mask cells where there's no similarity measure
+    S_i_ma = np.ma.masked_where(S_i == nodatavalue, S_i, copy=False)
+
+    # Overall similarity
+    S = S_i_ma.mean()
+    if method == 'rmse':
+        S = S ** 0.5
+    return S, S_i_ma
+
+
+QUANTIZED_NODATA = 65535
+
+# Rows and columns of the blocks of the streaming comparison of rasters in memory
+STREAM_TILE = 512
+
+
+def quantize(S_i, nodatavalue, low=None, high=None):
+    """ Quantizes local measures to uint16 with a scale and an offset (value = offset + scale * quantized value)
+
+    :param S_i: np.array, local measures
+    :param nodatavalue: float, value of the cells without a measure (they get QUANTIZED_NODATA)
+    :param low: float, optional, lowest value to represent, default is the lowest local measure
+    :param high: float, optional, highest value to represent, default is the highest local measure
+    :return: np.array (uint16) quantized local measures, scale, offset
+    """
+    with np.errstate(invalid='ignore'):
+        valid = (S_i != nodatavalue) & ~np.isnan(S_i)
+    values = S_i[valid].astype(float)
+    if low is None:
+        low = values.min() if values.size else 0.0
+    if high is None:
+        high = values.max() if values.size else 1.0
+    scale = (high - low) / (QUANTIZED_NODATA - 1) or 1.0
+    quantized = np.full(np.shape(S_i), QUANTIZED_NODATA, dtype=np.uint16)
+    quantized[valid] = np.rint(np.clip((values - low) / scale, 0, QUANTIZED_NODATA - 1))
+    return quantized, scale, low
+
+
+class StreamingStats:
+    """ Running statistics of local measures accumulated block by block, in double precision and without keeping the
+    blocks: count, sum, sum of squares, min, max and a histogram with fixed bins
+
+                :param bins: integer, number of bins of the histogram, default is 60 (as RasterDataPlotter.make_hist)
+                :param hist_range: tuple (low, high), range of the histogram, default is (-1, 1) (the range of the fuzzy
+                    similarity); the values out of it are counted in self.below and self.above
+    """
+
+    def __init__(self, bins=60, hist_range=(-1, 1)):
+        self.count = 0
+        self.sum = 0.0
+        self.sum_sq = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.edges = np.linspace(hist_range[0], hist_range[1], bins + 1)
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.below = 0
+        self.above = 0
+
+    def update(self, S_i, nodatavalue):
+        """ Adds the local measures of a block
+
+        :param S_i: np.array, local measures of the block
+        :param nodatavalue: float, value of the cells without a measure
+        """
+        values = np.asarray(S_i)[S_i != nodatavalue].astype(float)
+        if not values.size:
+            return
+        self.count += values.size
+        self.sum += values.sum()
+        self.sum_sq += np.dot(values, values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+        values = values[~np.isnan(values)]
+        self.counts += np.histogram(values, self.edges)[0]
+        self.below += np.count_nonzero(values < self.edges[0])
+        self.above += np.count_nonzero(values > self.edges[-1])
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else np.nan
+
+    @property
+    def std(self):
+        """ Population standard deviation of the local measures """
+        return max(self.sum_sq / self.count - self.mean ** 2, 0) ** 0.5 if self.count else np.nan
+
+    def histogram(self):
+        """ Histogram of the local measures
+
+        :return: np.array (int) counts of the bins, np.array (float) edges of the bins
+        """
+        return self.counts, self.edges
+
+
+class RunRecord:
+    """ Per-phase timings and progress of a comparison, reported to an optional callback
+
+    Every phase (ex.: 'read', 'kernel', 'A x B', 'B x A', 'reduction', 'write', 'tiles') reports progress(phase, 0,
+    total) when it starts, progress(phase, done, total) as it advances and progress(phase, total, total) when it ends,
+    which stores its duration in self.timings.
+
+                :param callback: callable, optional, called with a dict {'phase', 'done', 'total', 'elapsed', 'eta'} at
+                    every report, elapsed and eta being the seconds since the start of the phase and the estimated
+                    seconds left (None before the first step); an exception raised by the callback stops the comparison
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.timings = {}
+        self.starts = {}
+
+    def __getstate__(self):
+        # The callback stays in the main process (it may not be picklable)
+        return dict(self.__dict__, callback=None)
+
+    def reset(self, keep=('read', 'kernel')):
+        """ Forgets the timings of the previous comparison, except the ones of the phases in keep
+        """
+        self.timings = {phase: seconds for phase, seconds in self.timings.items() if phase in keep}
+
+    def progress(self, phase, done, total):
+        """ Reports that done of total steps of phase are done (done is 0 when the phase starts)
+        """
+        now = time.perf_counter()
+        if done == 0 or phase not in self.starts:
+            self.starts[phase] = now
+        elapsed = now - self.starts[phase]
+        if done >= total:
+            self.timings[phase] = elapsed
+        if self.callback is not None:
+            self.callback({'phase': phase, 'done': done, 'total': total, 'elapsed': elapsed,
+                           'eta': elapsed / done * (total - done) if done else None})
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ Times the block of a with statement as one step of phase name
+        """
+        self.progress(name, 0, 1)
+        yield
+        self.progress(name, 1, 1)
+
+    def iterate(self, phase, items, total, every=1000):
+        """ Yields the items, reporting the progress of phase every `every` items
+
+        :return: generator of the items
+        """
+        self.progress(phase, 0, total)
+        for done, item in enumerate(items, 1):
+            yield item
+            if done % every == 0 and done < total:
+                self.progress(phase, done, total)
+        self.progress(phase, total, total)
+
+
+def _batch_measures(task):
+    """ Compares one candidate with the reference of the BatchComparison kept in the worker process (see
+    processes.init_worker) """
+    candidate, method, local_map = task
+    S, S_i = processes.worker_state().compare(candidate, method)
+    return S, S_i if local_map else None
+
+
+def _baseline_measure(seed):
+    """ Global measure of one random realization of the observed map, with the FuzzyComparison and the settings
+    kept in the worker process (see processes.init_worker) """
+    comparison, method, mode, observed = processes.worker_state()
+    return comparison.random_measure(seed, method, mode, observed)
+
+
 class FuzzyComparison:
     """ Performing fuzzy map comparison
                 :param rasterA: string, path of the raster to be compared with rasterB
                 :param rasterB: string, path of the raster to be compared with rasterA
                 :param neigh: integer, neighborhood being considered (number of cells from the central cell), default is 4
                 :param halving_distance: integer, distance (in cells) to which the membership decays to its half, default is 2
+                :param engine: string, 'vectorized' (default) computes the best neighbour of every cell one kernel offset
+                    at a time over the whole raster, 'ring' visits the offsets of each cell from the nearest to the
+                    farthest and stops as soon as no farther offset can beat its best neighbour (see self.pruning),
+                    'loop' visits every cell with neighbours(); all give the same result. The pruning of 'ring' pays
+                    off for fuzzy numerical on maps with near matches, its cost still grows with (2n+1)^2 otherwise
+                    (fuzzy rmse on smooth maps mostly). 'levels' is approximate and its cost does not depend on neigh:
+                    it gives the exact result for the neighbour values rounded to the nearest multiple of tolerance
+                    (see engines.levels_reduce)
+                :param tolerance: float, optional, rounding step (in map units) of the neighbour values of the
+                    'levels' engine, its cost grows with the range of the values / tolerance; default is the largest
+                    range of the values of both maps / engines.LEVELS (required with tile_size)
+                :param decay: string, distance decay function of the membership (see engines.DECAY_FUNCTIONS), default
+                    is 'exponential'
+                :param tile_size: integer, optional, if given the rasters are not loaded in memory but compared in
+                    blocks of tile_size x tile_size cells (read with a halo of neigh cells and written straight into the
+                    comparison map)
+                :param workers: integer, number of processes sharing the comparison (bands of rows, or tiles if
+                    tile_size is given), default is 1; the result is the same as with a single process
+                :param memory_map: boolean, if True the rasters are read with read_raster_mmap (memory-mapped .npy
+                    sidecars holding the nodatavalue in the cells without data, instead of masked arrays), default is
+                    False; it has no effect with tile_size
+                :param sidecar_dir: string, optional, directory of the .npy sidecars, default is the directory of
+                    each raster
+                :param map_dtype: string, optional, None (default) computes the local measures in double precision
+                    and writes them in the data type of map A, 'float32' computes (running measures included, half
+                    the memory) and writes them in float32 and 'uint16' computes in float32 and writes the map of
+                    comparison quantized to uint16 with a scale and an offset (see quantize)
+                :param progress: callable, optional, receives the progress of every phase of the comparison (cells,
+                    bounding boxes, bands or tiles done, elapsed seconds and ETA, see RunRecord); the durations of the
+                    phases are kept in self.record.timings
+                :param run_record: boolean, if True every comparison also writes a run record (settings, sizes and
+                    timings of the phases, see save_run_record) as JSON next to its results file, default is False
+                :param cache: ResultCache or string (directory of a ResultCache), optional, on-disk cache of the global
+                    measures and local measures of fuzzy_numerical and fuzzy_rmse: a comparison of the same rasters
+                    with the same settings is read from the cache instead of being computed again (not used with
+                    tile_size)
     """
 
-    def __init__(self, rasterA, rasterB, neigh=4, halving_distance=2):
+    def __init__(self, rasterA, rasterB, neigh=4, halving_distance=2, engine='vectorized', decay='exponential',
+                 tile_size=None, workers=1, memory_map=False, sidecar_dir=None, map_dtype=None, progress=None,
+                 run_record=False, cache=None, tolerance=None):
+        self.record = RunRecord(progress)
+        self.run_record = run_record
+        self.record.progress('read', 0, 1)
         self.raster_A = rasterA
         self.raster_B = rasterB
         self.neigh = neigh
         self.halving_distance = halving_distance
-        self.array_A, self.nodatavalue, self.meta_A, self.src_A, self.dtype_A = read_raster(self.raster_A)
-        self.array_B, self.nodatavalue_B, self.meta_B, self.src_B, self.dtype_B = read_raster(self.raster_B)
+        self.engine = engine
+        self.tile_size = tile_size
+        self.workers = workers
+        self.memory_map = memory_map
+        self.sidecar_dir = sidecar_dir
+        if self.tile_size is None and memory_map:
+            self.array_A, self.nodatavalue, self.meta_A, self.src_A, self.dtype_A = read_raster_mmap(self.raster_A,
+                                                                                                   sidecar_dir)
+            self.array_B, self.nodatavalue_B, self.meta_B, self.src_B, self.dtype_B = read_raster_mmap(self.raster_B,
+                                                                                                   sidecar_dir)
+            if self.nodatavalue_B != self.nodatavalue:
+                # Map B keeps its own nodatavalue as a mask, the engines only know the one of map A
+                self.array_B = np.ma.masked_array(self.array_B, mask=engines.nodata_mask(self.array_B,
+                                                                                         self.nodatavalue_B))
+        elif self.tile_size is None:
+            self.array_A, self.nodatavalue, self.meta_A, self.src_A, self.dtype_A = read_raster(self.raster_A)
+            self.array_B, self.nodatavalue_B, self.meta_B, self.src_B, self.dtype_B = read_raster(self.raster_B)
+        else:
+            self.array_A, self.array_B = None, None
+            self.nodatavalue, self.meta_A, self.src_A, self.dtype_A = read_meta(self.raster_A)
+            self.nodatavalue_B, self.meta_B, self.src_B, self.dtype_B = read_meta(self.raster_B)
+        self.record.progress('read', 1, 1)
 
         if halving_distance <= 0:
             print('Halving distance must be at least 1')
@@ -80,6 +519,54 @@ class FuzzyComparison:
             sys.exit('MapError: Maps have different coordinate system')
         if self.dtype_A != self.dtype_B:
             print('Warning: Maps have different data types, I will use the datatype of the first map')
+        if self.engine not in engines.ENGINES:
+            raise ValueError('Unknown engine ' + str(self.engine) + ', choose one of ' + str(engines.ENGINES))
+        if self.engine == 'loop' and (self.tile_size is not None or self.workers > 1):
+            raise ValueError("Tiled and parallel comparisons require a whole-array engine, not 'loop'")
+        if self.engine == 'levels' and tolerance is None and self.tile_size is not None:
+            raise ValueError("The 'levels' engine requires a tolerance with tile_size")
+        if tolerance is not None and tolerance <= 0:
+            raise ValueError('The tolerance must be positive')
+        if map_dtype not in (None, 'float32', 'uint16'):
+            raise ValueError('Unknown map_dtype ' + str(map_dtype) + ", choose None, 'float32' or 'uint16'")
+        if self.tile_size is not None:
+            if (self.meta_A['height'], self.meta_A['width']) != (self.meta_B['height'], self.meta_B['width']):
+                sys.exit('MapError: Maps have different shapes')
+
+        # Data type of the local measures and metadata of the map of comparison
+        self.map_dtype = map_dtype
+        self.dtype_S = self.dtype_A if map_dtype is None else 'float32'
+        self.work_dtype = float if map_dtype is None else np.float32
+        self.meta_S = dict(self.meta_A, dtype=map_dtype or self.dtype_A)
+        if map_dtype == 'uint16':
+            self.meta_S['nodata'] = QUANTIZED_NODATA
+
+        # Membership kernel, computed once and shared by every comparison with the same settings
+        self.kernel_key = (self.neigh, self.halving_distance, decay)
+        with self.record.phase('kernel'):
+            self.kernel = engines.get_kernel(*self.kernel_key)
+
+        # Rounding step of the 'levels' engine, the same for every band, tile and update of the comparison
+        self.tolerance = tolerance
+        if self.engine == 'levels' and tolerance is None:
+            self.tolerance = engines.level_step(self.array_A, self.array_B, self.nodatavalue)
+
+        # Active (non-masked) cells of both maps, the only ones compared
+        self.active = (engines.active_cells(self.array_A, self.array_B, nodatavalue=self.nodatavalue)
+                       if self.tile_size is None else None)
+
+        # Statistics of the local measures of the last streaming (or tiled) comparison
+        self.stats = None
+
+        # (cell, offset) pairs evaluated and skipped by the 'ring' engine in the last in-memory comparison (summed
+        # over the bands of the workers)
+        self.pruning = {'evaluated': 0, 'pruned': 0}
+
+        # Cache of the results, identifying the rasters as they were read
+        self.cache = ResultCache(cache) if isinstance(cache, (str, Path)) else cache
+        self.fingerprints = None
+        if self.cache is not None:
+            self.fingerprints = (self.cache.fingerprint(self.raster_A), self.cache.fingerprint(self.raster_B))
 
     def neighbours(self, array, x, y):
         """ Captures the neighbours and their memberships
@@ -98,20 +585,22 @@ class FuzzyComparison:
         neigh_array = array[x_up: x_lower, y_up: y_lower]
         neigh_array = np.ma.masked_where(neigh_array == self.nodatavalue, neigh_array)
 
-        # Distance (in cells) of all neighbours to the cell in x,y in analysis
-        i, j = np.indices(neigh_array.shape)
-        i = i.flatten() - (x - x_up)
-        j = j.flatten() - (y - y_up)
-        d = np.reshape((i ** 2 + j ** 2) ** 0.5, neigh_array.shape)
-
-        # Calculate the membership based on the distance decay function
-        memb = 2 ** (-d / self.halving_distance)
+        # Membership of the neighbours (view of the precomputed kernel, clipped at the edges)
+        memb = self.kernel.window(x, y, array.shape)
 
         # Mask the array of memberships
         memb_ma = np.ma.masked_array(memb, mask=neigh_array.mask)
 
         return memb_ma[~memb_ma.mask], neigh_array[~neigh_array.mask]
 
+    def print_pruning(self):
+        """ Prints how many (cell, offset) evaluations the 'ring' engine skipped in the last comparison
+        """
+        total = self.pruning['evaluated'] + self.pruning['pruned']
+        if total:
+            print('Ring search: {} of {} neighbour evaluations pruned ({:.1f}%)'.format(
+                self.pruning['pruned'], total, 100 * self.pruning['pruned'] / total))
+
     def fuzzy_numerical(self, comparison_name, save_dir, map_of_comparison=True):
         """ Compares a pair of raster maps using fuzzy numerical spatial comparison
 
@@ -122,43 +611,66 @@ class FuzzyComparison:
         """
 
         print('Performing fuzzy numerical comparison...')
+        if self.tile_size is not None:
+            return self.tiled_comparison('numerical', comparison_name, save_dir, map_of_comparison)
+        self.record.reset()
+        S = self.cached_comparison('numerical', comparison_name, save_dir, map_of_comparison)
+        if S is not None:
+            return S
+
         # Two-way similarity, first A x B then B x A
-        s_AB = np.full(np.shape(self.array_A), self.nodatavalue, dtype=self.dtype_A)
-        s_BA = np.full(np.shape(self.array_A), self.nodatavalue, dtype=self.dtype_A)
+        self.pruning = {'evaluated': 0, 'pruned': 0}
+        if self.workers > 1:
+            s_AB, s_BA = self.parallel_two_way('numerical', self.pruning)
+            if self.engine == 'ring':
+                self.print_pruning()
+        elif self.engine != 'loop':
+            s_AB, s_BA = engines.two_way(self.array_A, self.array_B, self.kernel, 'numerical', self.nodatavalue,
+                                         self.dtype_S, engine=self.engine, stats=self.pruning, active=self.active,
+                                         progress=self.record.progress, work_dtype=self.work_dtype,
+                                         tolerance=self.tolerance)
+            if self.engine == 'ring':
+                self.print_pruning()
+        else:
+            s_AB = np.full(np.shape(self.array_A), self.nodatavalue, dtype=self.dtype_S)
+            s_BA = np.full(np.shape(self.array_A), self.nodatavalue, dtype=self.dtype_S)
 
-        #  Loop to calculate similarity A x B
-        for index, central in np.ndenumerate(self.array_A):
-            if not self.array_A.mask[index]:
+            #  Loop to calculate similarity A x B
+            for index in self.record.iterate('A x B', self.active[0].cells(), len(self.active[0])):
                 memb, neighboursA = self.neighbours(self.array_B, index[0], index[1])
                 f_i = np.ma.multiply(f_similarity(self.array_A[index], neighboursA), memb)
                 if f_i.size != 0:
                     s_AB[index] = np.nanmax(f_i)  # takes max without propagating nan
 
-        #  Loop to calculate similarity B x A
-        for index, central in np.ndenumerate(self.array_B):
-            if not self.array_B.mask[index]:
+            #  Loop to calculate similarity B x A
+            for index in self.record.iterate('B x A', self.active[1].cells(), len(self.active[1])):
                 memb, neighboursB = self.neighbours(self.array_A, index[0], index[1])
                 f_i = np.ma.multiply(f_similarity(self.array_B[index], neighboursB), memb)
                 if f_i.size != 0:
                     s_BA[index] = np.nanmax(f_i)  # takes max without propagating nan
 
-        S_i = np.minimum(s_AB, s_BA)
+        with self.record.phase('reduction'):
+            S_i = np.minimum(s_AB, s_BA, out=s_AB)  # reuses the buffer of s_AB
+            del s_BA
 
-        # Mask cells where there's no similarity measure
-        S_i_ma = np.ma.masked_where(S_i == self.nodatavalue, S_i, copy=True)
+            # Mask cells where there's no similarity measure
+            S_i_ma = np.ma.masked_where(S_i == self.nodatavalue, S_i, copy=False)
 
-        # Overall similarity
-        S = S_i_ma.mean()
+            # Overall similarity
+            S = S_i_ma.mean()
 
-        # Save results
-        self.save_results(S, save_dir, comparison_name)
+        with self.record.phase('write'):
+            # Save results
+            self.save_results(S, save_dir, comparison_name)
 
-        # Fill nodatavalues into array
-        S_i_ma_fi = np.ma.filled(S_i_ma, fill_value=self.nodatavalue)
+            # Masked cells already hold the nodatavalue, the local measures are saved as they are
+            S_i_ma_fi = np.ma.getdata(S_i_ma)
 
-        # Saves comparison raster
-        if map_of_comparison:
-            self.save_comparison_raster(S_i_ma_fi, save_dir, comparison_name)
+            # Saves comparison raster
+            if map_of_comparison:
+                self.save_comparison_raster(S_i_ma_fi, save_dir, comparison_name)
+            self.cache_result('numerical', S, S_i_ma_fi)
+        self.save_run_record(save_dir, comparison_name, 'numerical', S)
 
         return S
 
@@ -173,65 +685,791 @@ class FuzzyComparison:
         """
 
         print('Performing fuzzy RMSE comparison...')
+        if self.tile_size is not None:
+            return self.tiled_comparison('rmse', comparison_name, save_dir, map_of_comparison)
+        self.record.reset()
+        S = self.cached_comparison('rmse', comparison_name, save_dir, map_of_comparison)
+        if S is not None:
+            return S
 
         # Two-way similarity, first A x B then B x A
-        s_AB = np.full(np.shape(self.array_A), self.nodatavalue, dtype=self.dtype_A)
-        s_BA = np.full(np.shape(self.array_A), self.nodatavalue, dtype=self.dtype_A)
+        self.pruning = {'evaluated': 0, 'pruned': 0}
+        if self.workers > 1:
+            s_AB, s_BA = self.parallel_two_way('rmse', self.pruning)
+            if self.engine == 'ring':
+                self.print_pruning()
+        elif self.engine != 'loop':
+            s_AB, s_BA = engines.two_way(self.array_A, self.array_B, self.kernel, 'rmse', self.nodatavalue,
+                                         self.dtype_S, engine=self.engine, stats=self.pruning, active=self.active,
+                                         progress=self.record.progress, work_dtype=self.work_dtype,
+                                         tolerance=self.tolerance)
+            if self.engine == 'ring':
+                self.print_pruning()
+        else:
+            s_AB = np.full(np.shape(self.array_A), self.nodatavalue, dtype=self.dtype_S)
+            s_BA = np.full(np.shape(self.array_A), self.nodatavalue, dtype=self.dtype_S)
 
-        #  Loop to calculate similarity A x B
-        for index, central in np.ndenumerate(self.array_A):
-            if not self.array_A.mask[index]:
+            #  Loop to calculate similarity A x B
+            for index in self.record.iterate('A x B', self.active[0].cells(), len(self.active[0])):
                 memb, neighboursA = self.neighbours(self.array_B, index[0], index[1])
                 f_i = np.ma.divide(squared_error(self.array_A[index], neighboursA), memb)
                 if f_i.size != 0:
                     s_AB[index] = np.amin(f_i)
 
-        #  Loop to calculate similarity B x A
-        for index, central in np.ndenumerate(self.array_B):
-            if not self.array_B.mask[index]:
+            #  Loop to calculate similarity B x A
+            for index in self.record.iterate('B x A', self.active[1].cells(), len(self.active[1])):
                 memb, neighboursB = self.neighbours(self.array_A, index[0], index[1])
                 f_i = np.ma.divide(squared_error(self.array_B[index], neighboursB), memb)
                 if f_i.size != 0:
                     s_BA[index] = np.amin(f_i)
 
-        S_i = np.maximum(s_AB, s_BA)
+        with self.record.phase('reduction'):
+            S_i = np.maximum(s_AB, s_BA, out=s_AB)  # reuses the buffer of s_AB
+            del s_BA
 
-        # Mask cells where there's no similarity measure
-        S_i_ma = np.ma.masked_where(S_i == self.nodatavalue, S_i, copy=True)
+            # Mask cells where there's no similarity measure
+            S_i_ma = np.ma.masked_where(S_i == self.nodatavalue, S_i, copy=False)
 
-        # Overall similarity
-        S = (S_i_ma.mean()) ** 0.5
+            # Overall similarity
+            S = (S_i_ma.mean()) ** 0.5
+
+        with self.record.phase('write'):
+            # Save results
+            self.save_results(S, save_dir, comparison_name)
+
+            # Masked cells already hold the nodatavalue, the local measures are saved as they are
+            S_i_ma_fi = np.ma.getdata(S_i_ma)
+
+            # Save comparison raster
+            if map_of_comparison:
+                self.save_comparison_raster(S_i_ma_fi, save_dir, comparison_name)
+            self.cache_result('rmse', S, S_i_ma_fi)
+        self.save_run_record(save_dir, comparison_name, 'rmse', S)
+
+        return S
+
+    def cache_key(self, method):
+        """ Key of the comparison in the result cache
+
+        :param method: string, 'numerical' or 'rmse'
+        :return: string, or None without a cache (or with tile_size)
+        """
+        if self.cache is None or self.tile_size is not None:
+            return None
+        return self.cache.key(self.fingerprints, neigh=self.neigh, halving_distance=self.halving_distance,
+                              decay=self.kernel_key[2], method=method, engine=self.engine, map_dtype=self.map_dtype,
+                              tolerance=self.tolerance)
+
+    def cached_comparison(self, method, comparison_name, save_dir, map_of_comparison=True):
+        """ Saves the results of a comparison found in the result cache as the comparison would
+
+        :param method: string, 'numerical' or 'rmse'
+        :return: global measure, or None if the comparison is not cached
+        """
+        key = self.cache_key(method)
+        cached = self.cache.get(key) if key is not None else None
+        if cached is None:
+            return None
+        S, S_i = cached
+        print('Result read from the cache ' + str(self.cache.cache_dir))
+        with self.record.phase('write'):
+            self.save_results(S, save_dir, comparison_name)
+            if map_of_comparison:
+                self.save_comparison_raster(S_i, save_dir, comparison_name)
+        self.save_run_record(save_dir, comparison_name, method, S)
+        return S
+
+    def cache_result(self, method, S, S_i):
+        """ Stores the global measure and the local measures of a comparison in the result cache (if any)
+        """
+        key = self.cache_key(method)
+        if key is not None and S is not np.ma.masked:
+            self.cache.put(key, S, S_i, (self.raster_A, self.raster_B))
+
+    def two_way_measures(self, method='numerical'):
+        """ Two-way local measures of the rasters in memory, kept to update the comparison later (see update)
+
+        :param method: string, 'numerical' (fuzzy numerical similarity) or 'rmse' (fuzzy RMSE)
+        :return: np.array local measures of A x B, np.array local measures of B x A
+        """
+        if self.tile_size is not None:
+            raise ValueError('The two-way measures require the rasters in memory, they are not available with '
+                             'tile_size')
+        if self.workers > 1:
+            return self.parallel_two_way(method)
+        return engines.two_way(self.array_A, self.array_B, self.kernel, method, self.nodatavalue, self.dtype_S,
+                               engine='vectorized' if self.engine == 'loop' else self.engine, active=self.active,
+                               work_dtype=self.work_dtype, tolerance=self.tolerance)
+
+    def random_measure(self, seed, method='numerical', mode='shuffle', observed='A'):
+        """ Global measure of one random realization of the observed map against the other map, drawn in memory over
+        the valid cells of the observed map (one sample of the null model of random_baseline). The realization keeps
+        the mask of the observed map, so the measure covers the same cells as the comparison of map A and map B.
+
+        :param seed: int or np.random.SeedSequence, seed of the realization
+        :param method: string, 'numerical' (fuzzy numerical similarity) or 'rmse' (fuzzy RMSE)
+        :param mode: string, 'shuffle' (random permutation of the values of the observed map) or 'uniform' (uniform
+            values between the minimum and the maximum of the observed map, as PreProFuzzy.random_raster)
+        :param observed: string, 'A' (default) or 'B', the map holding the observations
+        :return: global measure
+        """
+        if observed not in ('A', 'B'):
+            raise ValueError('Unknown observed map ' + str(observed) + ", choose 'A' or 'B'")
+        array = self.array_A if observed == 'A' else self.array_B
+        valid = ~engines.nodata_mask(array, self.nodatavalue)
+        values = np.ma.getdata(array)[valid]
+        rng = np.random.default_rng(seed)
+        realization = np.zeros(np.shape(array), dtype=values.dtype)
+        if mode == 'shuffle':
+            realization[valid] = rng.permutation(values)
+        elif mode == 'uniform':
+            realization[valid] = rng.uniform(values.min(), values.max(), values.size) if values.size else values
+        else:
+            raise ValueError('Unknown mode ' + str(mode) + ", choose 'shuffle' or 'uniform'")
+        realization = np.ma.array(realization, mask=~valid)
+
+        array_A, array_B = (realization, self.array_B) if observed == 'A' else (self.array_A, realization)
+        s_AB, s_BA = engines.two_way(array_A, array_B, self.kernel, method, self.nodatavalue, self.dtype_S,
+                                     engine='vectorized' if self.engine == 'loop' else self.engine,
+                                     active=self.active, work_dtype=self.work_dtype, tolerance=self.tolerance)
+        S, _ = global_measure(local_measures(s_AB, s_BA, method), method, self.nodatavalue)
+        return S
+
+    def random_baseline(self, n=100, method='numerical', mode='shuffle', seed=None, comparison_name=None,
+                        save_dir=None, observed='A'):
+        """ Monte Carlo null model of the comparison: n random realizations of the observed map (see random_measure)
+        are compared with the other map (model), scored in memory by the worker processes, and the global measure of
+        map A and map B is ranked among them
+
+        :param n: integer, number of random realizations, default is 100
+        :param method: string, 'numerical' (fuzzy numerical similarity) or 'rmse' (fuzzy RMSE)
+        :param mode: string, 'shuffle' (default) or 'uniform', see random_measure
+        :param seed: int, optional, seed of the realizations (the results do not depend on the number of workers)
+        :param comparison_name: string, optional, name of the table (*.csv) of the random global measures
+        :param save_dir: string, optional, directory where to save the table
+        :param observed: string, 'A' (default) or 'B', the map holding the observations (ex.: 'B' when map A is the
+            simulation and map B the measurements)
+        :return: global measure of map A and map B, np.array of the global measures of the realizations, p-value
+            (share of the realizations, counting the model itself, at least as good as the model)
+        """
+        if self.tile_size is not None:
+            raise ValueError('The random baseline requires the rasters in memory, it is not available with tile_size')
+        if observed not in ('A', 'B'):
+            raise ValueError('Unknown observed map ' + str(observed) + ", choose 'A' or 'B'")
+        print('Performing Monte Carlo baseline of fuzzy ' + method + ' comparison with ' + str(n) + ' realizations...')
+        s_AB, s_BA = self.two_way_measures(method)
+        S, _ = global_measure(local_measures(s_AB, s_BA, method), method, self.nodatavalue)
+        del s_AB, s_BA
+
+        seeds = np.random.SeedSequence(seed).spawn(n)
+        if self.workers > 1:
+            with multiprocessing.Pool(self.workers, initializer=processes.init_worker,
+                                      initargs=((self, method, mode, observed),)) as pool:
+                distribution = np.array(pool.map(_baseline_measure, seeds), dtype=float)
+        else:
+            distribution = np.array([self.random_measure(seed, method, mode, observed) for seed in seeds], dtype=float)
+
+        # Higher similarity, or lower error, is better
+        better = distribution >= S if method == 'numerical' else distribution <= S
+        p_value = (1 + np.count_nonzero(better)) / (n + 1)
+        print('Random baseline: ', np.nanmean(distribution), ' +/- ', np.nanstd(distribution), ', p-value: ', p_value)
+
+        if comparison_name is not None and save_dir is not None:
+            if '.' not in comparison_name[-4:]:
+                comparison_name += '.csv'
+            with open(save_dir + '/' + comparison_name, 'w') as table:
+                table.write('realization,' + ('fuzzy_similarity' if method == 'numerical' else 'fuzzy_rmse') + '\n')
+                table.write('model,' + str(S) + '\n')
+                for realization, S_random in enumerate(distribution):
+                    table.write(str(realization) + ',' + str(S_random) + '\n')
+        return S, distribution, p_value
+
+    def update(self, s_AB, s_BA, rasterB=None, changed=None, method='numerical', comparison_name=None, save_dir=None,
+               map_of_comparison=False):
+        """ Compares again after map B was edited locally: only the cells within neigh cells of the changes are
+        computed again, the two-way measures of the other cells are kept
+
+        :param s_AB: np.array, local measures of A x B of the previous map B (see two_way_measures), updated in place
+        :param s_BA: np.array, local measures of B x A of the previous map B, updated in place
+        :param rasterB: string, optional, path of the edited map B, default is the path of the current map B
+        :param changed: tuple (row_start, row_stop, col_start, col_stop) of the changed window, or np.array of
+            booleans flagging the changed cells, optional, default is every cell whose value or mask differs between
+            the current and the edited map B
+        :param method: string, 'numerical' (fuzzy numerical similarity) or 'rmse' (fuzzy RMSE), as the one of s_AB and
+            s_BA
+        :param comparison_name: string, optional, name of the comparison (results file and map of comparison)
+        :param save_dir: string, optional, directory where to save the results
+        :param map_of_comparison: boolean, create map of comparison in save_dir if True, default is False
+        :return: global measure, np.array s_AB, np.array s_BA
+        """
+        if self.tile_size is not None:
+            raise ValueError('Updating a comparison requires the rasters in memory, it is not available with tile_size')
+        print('Updating fuzzy ' + method + ' comparison...')
+        rasterB = self.raster_B if rasterB is None else rasterB
+        if self.memory_map:
+            array_B, nodatavalue_B, meta_B, src_B, dtype_B = read_raster_mmap(rasterB, self.sidecar_dir)
+            if nodatavalue_B != self.nodatavalue:
+                array_B = np.ma.masked_array(array_B, mask=engines.nodata_mask(array_B, nodatavalue_B))
+        else:
+            array_B, nodatavalue_B, meta_B, src_B, dtype_B = read_raster(rasterB)
+        if src_B != self.src_A or np.shape(array_B) != np.shape(self.array_A):
+            sys.exit('MapError: ' + str(rasterB) + ' has a different coordinate system or shape than map A')
+
+        # Changed cells of map B
+        if changed is None:
+            old, new = np.ma.getdata(self.array_B), np.ma.getdata(array_B)
+            with np.errstate(invalid='ignore'):
+                changed = ~((old == new) | (np.isnan(old) & np.isnan(new)))
+            changed |= engines.nodata_mask(self.array_B, self.nodatavalue) != engines.nodata_mask(array_B,
+                                                                                                self.nodatavalue)
+        elif not isinstance(changed, np.ndarray):
+            row_start, row_stop, col_start, col_stop = changed
+            changed = np.zeros(np.shape(self.array_A), dtype=bool)
+            changed[row_start:row_stop, col_start:col_stop] = True
+        self.raster_B, self.array_B, self.nodatavalue_B, self.meta_B = rasterB, array_B, nodatavalue_B, meta_B
+        if self.cache is not None:
+            self.fingerprints = (self.fingerprints[0], self.cache.fingerprint(rasterB))
+        self.active = engines.active_cells(self.array_A, self.array_B, nodatavalue=self.nodatavalue)
+
+        # Two-way measures of the cells within neigh cells of the changes, each region with its halo
+        n = self.kernel.neigh
+        engine = 'vectorized' if self.engine == 'loop' else self.engine
+        for rows, cols in engines.affected_boxes(changed, n):
+            block_A, block_B = [array_block(array, rows.start, cols.start, rows.stop - rows.start,
+                                            cols.stop - cols.start, n, self.nodatavalue)
+                                for array in (self.array_A, self.array_B)]
+            s_AB[rows, cols], s_BA[rows, cols] = engines.two_way(block_A, block_B, self.kernel, method,
+                                                                 self.nodatavalue, s_AB.dtype, halo=True,
+                                                                 engine=engine,
+                                                                 active=engines.active_cells(block_A, block_B, n),
+                                                                 work_dtype=self.work_dtype,
+                                                                 tolerance=self.tolerance)
+
+        # Overall measure, the two-way measures are kept for the next update
+        S, S_i_ma = global_measure(local_measures(s_AB.copy(), s_BA, method), method, self.nodatavalue)
 
         # Save results
-        self.save_results(S, save_dir, comparison_name)
+        if comparison_name is not None and save_dir is not None:
+            self.save_results(S, save_dir, comparison_name)
+            if map_of_comparison:
+                self.save_comparison_raster(np.ma.getdata(S_i_ma), save_dir, comparison_name)
+        return S, s_AB, s_BA
+
+    def sweep(self, neighs, halving_distances, method='numerical', comparison_name=None, save_dir=None):
+        """ Sensitivity analysis of the global measure to the neighbourhood and the halving distance
+
+        All (neigh, halving_distance) pairs of the grid are evaluated in a single pass over the rasters: the measure of
+        each kernel offset is computed once and reduced under every kernel reaching it. Each global measure is the same
+        as the one of a FuzzyComparison with that neigh and halving_distance (and the decay function of this one).
+
+        :param neighs: list of integers, neighbourhoods (number of cells from the central cell)
+        :param halving_distances: list of integers, halving distances (in cells)
+        :param method: string, 'numerical' (fuzzy numerical similarity) or 'rmse' (fuzzy RMSE)
+        :param comparison_name: string, optional, name of the table (*.csv) of results
+        :param save_dir: string, optional, directory where to save the table of results
+        :return: list of tuples (neigh, halving_distance, global measure)
+        """
+        if self.tile_size is not None:
+            raise ValueError('The sweep requires the rasters in memory, it is not available with tile_size')
+        pairs = [(neigh, halving_distance) for neigh in neighs for halving_distance in halving_distances]
+        print('Performing fuzzy ' + method + ' sweep over ' + str(len(pairs)) + ' settings...')
+        kernels = [engines.get_kernel(neigh, halving_distance, self.kernel.decay) for neigh, halving_distance in pairs]
+        measures = engines.sweep_two_way(self.array_A, self.array_B, kernels, method, self.nodatavalue, self.dtype_S,
+                                         active=self.active, work_dtype=self.work_dtype)
+
+        results = []
+        for (neigh, halving_distance), (s_AB, s_BA) in zip(pairs, measures):
+            S, _ = global_measure(local_measures(s_AB, s_BA, method), method, self.nodatavalue)
+            results.append((neigh, halving_distance, S))
+
+        if save_dir is not None and comparison_name is not None:
+            if '.' not in comparison_name[-4:]:
+                comparison_name += '.csv'
+            with open(save_dir + '/' + comparison_name, 'w') as table:
+                table.write('neigh,halving_distance,' + ('fuzzy_similarity' if method == 'numerical' else 'fuzzy_rmse')
+                            + '\n')
+                for neigh, halving_distance, S in results:
+                    table.write(str(neigh) + ',' + str(halving_distance) + ',' + str(S) + '\n')
+        return results
+
+    def parallel_two_way(self, method, stats=None):
+        """ Two-way local measures computed by a pool of workers, each one taking bands of rows with a halo of neigh
+        rows. The rasters are shared through memory-mapped files instead of being sent to each process, and the bands
+        are stitched into the same s_AB and s_BA of the single process comparison.
+
+        :param method: string, 'numerical' or 'rmse'
+        :param stats: dict, optional, its counts of evaluated and pruned (cell, offset) pairs of the 'ring' engine are
+            increased with the ones of every band
+        :return: np.array local measures of A x B, np.array local measures of B x A
+        """
+        rows = np.shape(self.array_A)[0]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files = {name: os.path.join(tmp_dir, name + '.npy')
+                     for name in ('A', 'B', 'mask_A', 'mask_B', 's_AB', 's_BA')}
+            np.save(files['A'], np.ma.getdata(self.array_A))
+            np.save(files['B'], np.ma.getdata(self.array_B))
+            np.save(files['mask_A'], engines.nodata_mask(self.array_A, self.nodatavalue))
+            np.save(files['mask_B'], engines.nodata_mask(self.array_B, self.nodatavalue))
+            for name in ('s_AB', 's_BA'):
+                out = np.lib.format.open_memmap(files[name], mode='w+', dtype=self.dtype_S,
+                                                shape=np.shape(self.array_A))
+                out.flush()
+                del out
+
+            # Several bands per worker to balance the load
+            bands = [band for band in np.array_split(np.arange(rows), 4 * self.workers) if band.size]
+            tasks = [(files, int(band[0]), int(band[-1]) + 1, self.kernel_key, method, self.nodatavalue, self.engine,
+                      self.work_dtype, self.tolerance) for band in bands]
+            with multiprocessing.Pool(self.workers) as pool:
+                # Both passes run in the workers, the bands are reported as they finish
+                self.record.progress('two-way', 0, len(tasks))
+                for done, band_stats in enumerate(pool.imap_unordered(_band_measures, tasks), 1):
+                    if stats is not None:
+                        for key, count in band_stats.items():
+                            stats[key] = stats.get(key, 0) + count
+                    self.record.progress('two-way', done, len(tasks))
+
+            s_AB = np.array(np.load(files['s_AB']))
+            s_BA = np.array(np.load(files['s_BA']))
+        return s_AB, s_BA
+
+    def iter_tiles(self, method, tile_size):
+        """ Local measures of the rasters block by block: each block of tile_size x tile_size cells is compared with a
+        halo of neigh cells, taken from the rasters in memory or read from the files (by the worker processes if
+        workers > 1)
+
+        :param method: string, 'numerical' or 'rmse'
+        :param tile_size: integer, number of rows and columns of the blocks
+        :return: generator of tuples (rasterio Window of the block, np.array local measures of the block), in order
+        """
+        windows = [rio.windows.Window(col_off, row_off, min(tile_size, self.meta_A['width'] - col_off),
+                                      min(tile_size, self.meta_A['height'] - row_off))
+                   for row_off in range(0, self.meta_A['height'], tile_size)
+                   for col_off in range(0, self.meta_A['width'], tile_size)]
+
+        self.record.progress('tiles', 0, len(windows))
+        if self.array_A is not None:
+            n = self.kernel.neigh
+            for done, window in enumerate(windows, 1):
+                block_A, block_B = [array_block(array, window.row_off, window.col_off, window.height, window.width, n,
+                                                self.nodatavalue) for array in (self.array_A, self.array_B)]
+                s_AB, s_BA = engines.two_way(block_A, block_B, self.kernel, method, self.nodatavalue, self.dtype_S,
+                                             halo=True, engine=self.engine,
+                                             active=engines.active_cells(block_A, block_B, n),
+                                             work_dtype=self.work_dtype, tolerance=self.tolerance)
+                yield window, local_measures(s_AB, s_BA, method)
+                self.record.progress('tiles', done, len(windows))
+            return
+
+        tasks = ((self.raster_A, self.raster_B, w.row_off, w.col_off, w.height, w.width, self.kernel_key, method,
+                  self.nodatavalue, self.dtype_S, self.engine, self.work_dtype, self.tolerance) for w in windows)
+        pool = multiprocessing.Pool(self.workers) if self.workers > 1 else None
+        try:
+            # Tiles come back in order, so the accumulation does not depend on the number of workers
+            results = pool.imap(_tile_measures, tasks) if pool else map(_tile_measures, tasks)
+            for done, (window, S_i) in enumerate(zip(windows, results), 1):
+                yield window, S_i
+                self.record.progress('tiles', done, len(windows))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
 
-        # Fill nodatavalues into array
-        S_i_ma_fi = np.ma.filled(S_i_ma, fill_value=self.nodatavalue)
+    def global_statistics(self, method='numerical', bins=60, hist_range=None, comparison_name=None, save_dir=None):
+        """ Global measure and statistics of the local measures, accumulated block by block (see iter_tiles) without
+        building the map of comparison, so that memory stays in the order of one block and no raster is written
 
-        # Save comparison raster
+        :param method: string, 'numerical' (fuzzy numerical similarity) or 'rmse' (fuzzy RMSE)
+        :param bins: integer, number of bins of the histogram of the local measures, default is 60
+        :param hist_range: tuple (low, high), optional, range of the histogram, default is (-1, 1) for fuzzy numerical
+            and (0, 1) for fuzzy rmse (squared errors)
+        :param comparison_name: string, optional, name of the comparison (results file)
+        :param save_dir: string, optional, directory where to save the results file
+        :return: global measure, StreamingStats of the local measures
+        """
+        if method not in ('numerical', 'rmse'):
+            raise ValueError('Unknown method ' + str(method) + ", choose 'numerical' or 'rmse'")
+        print('Performing streaming fuzzy ' + method + ' comparison...')
+        self.record.reset()
+        stats = StreamingStats(bins, hist_range or ((-1, 1) if method == 'numerical' else (0, 1)))
+        for _, S_i in self.iter_tiles(method, self.tile_size or STREAM_TILE):
+            stats.update(S_i, self.nodatavalue)
+        self.stats = stats
+
+        # Overall similarity (accumulated in double precision)
+        S = stats.mean if method == 'numerical' else stats.mean ** 0.5
+
+        # Save results
+        if comparison_name is not None and save_dir is not None:
+            self.save_results(S, save_dir, comparison_name, extra={'Minimum local measure': stats.min,
+                                                                   'Maximum local measure': stats.max,
+                                                                   'Standard deviation of local measures': stats.std})
+            self.save_run_record(save_dir, comparison_name, method, S)
+        return S, stats
+
+    def tiled_comparison(self, method, comparison_name, save_dir, map_of_comparison=True):
+        """ Compares the rasters block by block without loading them in memory
+
+        Each block of tile_size x tile_size cells is read with a halo of neigh cells (by the worker processes if
+        workers > 1), its local measures are written straight into the comparison map and the global measure is
+        accumulated on the go (in double precision, so it may differ from the in-memory comparison in the last digits).
+
+        :param method: string, 'numerical' (fuzzy_numerical) or 'rmse' (fuzzy_rmse)
+        :param comparison_name: string, name of the comparison
+        :param save_dir: string, directory where to save the results
+        :param map_of_comparison: boolean, create map of comparison in the project directory if True
+        :return: global measure of the comparison
+        """
+        if map_of_comparison and self.map_dtype == 'uint16' and method == 'rmse':
+            raise ValueError("The range of the local errors is not known before the end of a tiled comparison, use "
+                             "map_dtype='float32' with fuzzy_rmse")
+        self.record.reset()
+        stats = StreamingStats(hist_range=(-1, 1) if method == 'numerical' else (0, 1))
+        comp_map = None
         if map_of_comparison:
-            self.save_comparison_raster(S_i_ma_fi, save_dir, comparison_name)
+            file_name = comparison_name if '.' in comparison_name[-4:] else comparison_name + '.tif'
+            comp_map = rio.open(save_dir + '/' + file_name, 'w', **self.meta_S)
+            if self.map_dtype == 'uint16':
+                # Fixed range of the similarity, the tiles are quantized one at a time
+                comp_map.scales, comp_map.offsets = (2 / (QUANTIZED_NODATA - 1),), (-1.0,)
+
+        try:
+            for window, S_i in self.iter_tiles(method, self.tile_size):
+                # Accumulate the cells with a similarity measure
+                stats.update(S_i, self.nodatavalue)
+
+                if comp_map is not None and self.map_dtype == 'uint16':
+                    comp_map.write(quantize(S_i, self.nodatavalue, -1.0, 1.0)[0], 1, window=window)
+                elif comp_map is not None:
+                    comp_map.write(S_i, 1, window=window)
+        finally:
+            if comp_map is not None:
+                comp_map.close()
+        self.stats = stats
+
+        # Overall similarity
+        S = stats.mean
+        if method == 'rmse':
+            S = S ** 0.5
+
+        # Save results (the blocks of the map are written with the tiles)
+        with self.record.phase('write'):
+            self.save_results(S, save_dir, comparison_name)
+        self.save_run_record(save_dir, comparison_name, method, S)
 
         return S
 
-    def save_results(self, measure, dir, name):
-        """Saves a results file"""
+    def fuzzy_kappa(self, comparison_name, save_dir, similarity_matrix=None, map_of_comparison=True):
+        """ Compares a pair of classified raster maps (ex.: from PreProCategorization.categorize_raster) using the
+        fuzzy kappa of Hagen (2003)
+
+        The fuzzy membership of each category around a cell is the decayed distance to its nearest occurrence within
+        neigh cells (a disc), computed with one distance transform per category. The local similarity is the minimum of
+        the two-way similarities, and the fuzzy kappa corrects their average P for the expected agreement E of maps
+        with the same category frequencies: K = (P - E) / (1 - E).
+
+        :param comparison_name: string, name of the comparison
+        :param save_dir: string, directory where to save the results
+        :param similarity_matrix: np.array (k x k), optional, similarity between the k categories found in the maps
+            (sorted by value), default is the identity (no similarity between different categories)
+        :param map_of_comparison: boolean, create map of comparison in the project directory if True
+        :return: fuzzy kappa, average fuzzy similarity P, expected fuzzy similarity E
+        """
+        print('Performing fuzzy kappa comparison...')
+        if self.tile_size is not None:
+            raise ValueError('The fuzzy kappa requires the rasters in memory, it is not available with tile_size')
+
+        valid_A = engines.valid_cells(self.array_A, self.nodatavalue)
+        valid_B = engines.valid_cells(self.array_B, self.nodatavalue)
+        categories = np.union1d(np.ma.getdata(self.array_A)[valid_A], np.ma.getdata(self.array_B)[valid_B])
+        if similarity_matrix is None:
+            similarity_matrix = np.identity(categories.size)
+        similarity_matrix = np.asarray(similarity_matrix, dtype=float)
+        if similarity_matrix.shape != (categories.size, categories.size):
+            raise ValueError('The similarity matrix must be ' + str(categories.size) + ' x ' + str(categories.size) +
+                             ', one row and column for each category ' + str(categories))
+
+        # Fuzzy membership of each category in the neighbourhood of the compared cells
+        both = valid_A & valid_B
+        fuzzy_A = engines.fuzzy_categories(
+            [memb[both] for memb in engines.category_memberships(self.array_A, valid_A, categories, self.kernel)],
+            similarity_matrix)
+        fuzzy_B = engines.fuzzy_categories(
+            [memb[both] for memb in engines.category_memberships(self.array_B, valid_B, categories, self.kernel)],
+            similarity_matrix)
+
+        # Two-way similarity: membership of the category of A in the neighbourhood in B, and vice versa
+        index_A = np.searchsorted(categories, np.ma.getdata(self.array_A)[both])
+        index_B = np.searchsorted(categories, np.ma.getdata(self.array_B)[both])
+        cells = np.arange(index_A.size)
+        s_i = np.minimum(fuzzy_B[index_A, cells], fuzzy_A[index_B, cells])
+
+        # Average similarity, expected similarity and fuzzy kappa
+        P = s_i.mean() if s_i.size else np.nan
+        E = engines.expected_agreement(fuzzy_A, fuzzy_B, index_A, index_B, similarity_matrix) if s_i.size else np.nan
+        K = (P - E) / (1 - E) if E != 1 else np.nan
+        print('Average fuzzy similarity: ', P, ' Expected fuzzy similarity: ', E)
+
+        # Save results
+        self.save_results(K, save_dir, comparison_name, title='Fuzzy kappa spatial comparison',
+                          extra={'Average fuzzy similarity': P, 'Expected fuzzy similarity': E}, label='Fuzzy kappa')
+
+        # Saves comparison raster
+        if map_of_comparison:
+            S_i = np.full(np.shape(self.array_A), self.nodatavalue, dtype=self.dtype_S)
+            S_i[both] = s_i
+            self.save_comparison_raster(S_i, save_dir, comparison_name)
+
+        return K, P, E
+
+    def save_results(self, measure, dir, name, title='Fuzzy numerical spatial comparison', extra=None,
+                     label='Average fuzzy similarity'):
+        """Saves a results file
+
+        :param extra: dict, optional, other measures (label: value) written before the measure
+        """
         if '.' not in name[-4:]:
             name += '.txt'
         result_file = dir + '/' + name
-        lines = ["Fuzzy numerical spatial comparison \n", "\n", "Compared maps: \n",
+        lines = [title + " \n", "\n", "Compared maps: \n",
                  str(self.raster_A) + "\n", str(self.raster_B) + "\n", "\n", "Halving distance: " +
                  str(self.halving_distance) + " cells  \n", "Neighbourhood: " + str(self.neigh) + " cells  \n", "\n"]
         file1 = open(result_file, "w")
         file1.writelines(lines)
-        file1.write('Average fuzzy similarity: ' + str(format(measure, '.4f')))
+        for key, value in (extra or {}).items():
+            file1.write(key + ': ' + str(format(value, '.4f')) + '\n')
+        file1.write(label + ': ' + str(format(measure, '.4f')))
         file1.close()
 
+    def save_run_record(self, dir, name, method, measure):
+        """ Saves the run record of the last comparison (settings, sizes, global measure and timings of the phases in
+        seconds) as JSON next to its results file, if run_record is True
+
+        :param dir: string, directory of the results file
+        :param name: string, name of the comparison (results file)
+        :param method: string, 'numerical' or 'rmse'
+        :param measure: float, global measure of the comparison
+        """
+        if not self.run_record:
+            return
+        if '.' in name[-4:]:
+            name = name.rsplit('.', 1)[0]
+        record = {'maps': [str(self.raster_A), str(self.raster_B)], 'method': method, 'engine': self.engine,
+                  'neigh': self.neigh, 'halving_distance': self.halving_distance, 'decay': self.kernel_key[2],
+                  'tile_size': self.tile_size, 'workers': self.workers, 'memory_map': self.memory_map,
+                  'map_dtype': self.map_dtype, 'tolerance': self.tolerance, 'rows': self.meta_A['height'],
+                  'cols': self.meta_A['width'],
+                  'active_cells': [len(active) for active in self.active] if self.active else None,
+                  'measure': float(measure), 'timings': self.record.timings,
+                  'total_seconds': sum(self.record.timings.values()),
+                  'finished': datetime.now().isoformat(timespec='seconds')}
+        if self.engine == 'ring' and self.tile_size is None:
+            record['pruning'] = {key: int(value) for key, value in self.pruning.items()}
+        with open(dir + '/' + name + '.json', 'w') as file:
+            json.dump(record, file, indent=1)
+
     def save_comparison_raster(self, array_local_measures, dir, file_name):
         """Create map of comparison"""
         if '.' not in file_name[-4:]:
             file_name += '.tif'
         comp_map = dir + "/" + file_name
-        raster = rio.open(comp_map, 'w', **self.meta_A)
+        raster = rio.open(comp_map, 'w', **self.meta_S)
+        if self.map_dtype == 'uint16':
+            array_local_measures, scale, offset = quantize(array_local_measures, self.nodatavalue)
+            raster.scales, raster.offsets = (scale,), (offset,)
         raster.write(array_local_measures, 1)
         raster.close()
+
+
+class BatchComparison:
+    """ Compares one reference raster with many candidate rasters (ex.: the observed map with the outputs of a
+    calibration). The reference is read, masked and padded only once and the membership kernel is shared by all
+    comparisons. Each global measure is the same as the one of FuzzyComparison(reference, candidate).
+
+                :param reference: string, path of the reference raster (map A of every comparison)
+                :param neigh: integer, neighborhood being considered (number of cells from the central cell), default is 4
+                :param halving_distance: integer, distance (in cells) to which the membership decays to its half, default is 2
+                :param decay: string, distance decay function of the membership (see engines.DECAY_FUNCTIONS), default
+                    is 'exponential'
+                :param engine: string, whole-array engine of the comparisons ('vectorized', 'ring' or 'levels'),
+                    default is 'vectorized'
+                :param tolerance: float, optional, rounding step of the neighbour values of the 'levels' engine
+                    (see FuzzyComparison), default is engines.level_step of each pair of maps
+    """
+
+    def __init__(self, reference, neigh=4, halving_distance=2, decay='exponential', engine='vectorized',
+                 tolerance=None):
+        self.reference = reference
+        self.neigh = neigh
+        self.halving_distance = halving_distance
+        self.engine = engine
+        self.tolerance = tolerance
+        self.array_ref, self.nodatavalue, self.meta, self.crs, self.dtype = read_raster(self.reference)
+
+        if halving_distance <= 0:
+            print('Halving distance must be at least 1')
+        if self.engine not in engines.ENGINES or self.engine == 'loop':
+            raise ValueError('Unknown engine ' + str(self.engine) + ', choose one of ' + str(engines.ENGINES[1:]))
+
+        self.kernel_key = (self.neigh, self.halving_distance, decay)
+        self.kernel = engines.get_kernel(*self.kernel_key)
+
+        # Reference with its halo of masked cells, ready for every comparison
+        pad = ((self.neigh, self.neigh), (self.neigh, self.neigh))
+        self.block_ref = pad_block(np.ma.getdata(self.array_ref), np.ma.getmaskarray(self.array_ref), pad)
+        self.active_ref = engines.ActiveCells(~np.ma.getmaskarray(self.array_ref))
+
+    def compare(self, candidate, method='numerical'):
+        """ Compares the reference with one candidate raster
+
+        :param candidate: string, path of the candidate raster
+        :param method: string, 'numerical' (fuzzy numerical similarity) or 'rmse' (fuzzy RMSE)
+        :return: global measure, np.array of local measures (filled with the nodatavalue of the reference)
+        """
+        array, nodatavalue, meta, crs, dtype = read_raster(candidate)
+        if crs != self.crs or np.shape(array) != np.shape(self.array_ref):
+            print('MapError: ' + str(candidate) + ' has a different coordinate system or shape than the reference, '
+                  'it is skipped')
+            return np.nan, None
+
+        pad = ((self.neigh, self.neigh), (self.neigh, self.neigh))
+        block = pad_block(np.ma.getdata(array), np.ma.getmaskarray(array), pad)
+        s_AB, s_BA = engines.two_way(self.block_ref, block, self.kernel, method, self.nodatavalue, self.dtype,
+                                     halo=True, engine=self.engine,
+                                     active=(self.active_ref, engines.ActiveCells(~np.ma.getmaskarray(array))),
+                                     tolerance=self.tolerance)
+        S, S_i_ma = global_measure(local_measures(s_AB, s_BA, method), method, self.nodatavalue)
+        return S, np.ma.filled(S_i_ma, fill_value=self.nodatavalue)
+
+    def iter_compare(self, candidates, method='numerical', local_map=False, workers=1):
+        """ Compares the reference with each candidate, yielding the results in the order of the candidates
+
+        :param candidates: list or iterator of strings, paths of the candidate rasters
+        :param method: string, 'numerical' (fuzzy numerical similarity) or 'rmse' (fuzzy RMSE)
+        :param local_map: boolean, if True the local measures are yielded too (otherwise None)
+        :param workers: integer, number of processes comparing candidates at the same time, default is 1
+        :return: generator of tuples (candidate, global measure, np.array of local measures or None)
+        """
+        candidates, to_compare = itertools.tee(candidates)
+        tasks = zip(to_compare, itertools.repeat(method), itertools.repeat(local_map))
+        if workers > 1:
+            with multiprocessing.Pool(workers, initializer=processes.init_worker, initargs=(self,)) as pool:
+                for candidate, (S, S_i) in zip(candidates, pool.imap(_batch_measures, tasks)):
+                    yield candidate, S, S_i
+        else:
+            for candidate, method, local_map in tasks:
+                S, S_i = self.compare(candidate, method)
+                yield candidate, S, S_i if local_map else None
+
+    def run(self, candidates, comparison_name, save_dir, method='numerical', map_of_comparison=False, workers=1):
+        """ Compares the reference with each candidate and writes a table (*.csv) of the global measures, one row
+        written as soon as each comparison is done
+
+        :param candidates: list or iterator of strings, paths of the candidate rasters
+        :param comparison_name: string, name of the table (and prefix of the comparison maps)
+        :param save_dir: string, directory where to save the results
+        :param method: string, 'numerical' (fuzzy numerical similarity) or 'rmse' (fuzzy RMSE)
+        :param map_of_comparison: boolean, if True saves the map of comparison of each candidate
+        :param workers: integer, number of processes comparing candidates at the same time, default is 1
+        :return: list of tuples (candidate, global measure)
+        """
+        print('Performing batch fuzzy ' + method + ' comparison with reference ' + str(self.reference) + '...')
+        if '.' not in comparison_name[-4:]:
+            comparison_name += '.csv'
+        results = []
+        with open(save_dir + '/' + comparison_name, 'w') as table:
+            table.write('candidate,' + ('fuzzy_similarity' if method == 'numerical' else 'fuzzy_rmse') + '\n')
+            for candidate, S, S_i in self.iter_compare(candidates, method, map_of_comparison, workers):
+                table.write(str(candidate) + ',' + str(S) + '\n')
+                table.flush()
+                results.append((candidate, S))
+                if S_i is not None:
+                    comp_map = save_dir + '/' + comparison_name[:-4] + '_' + Path(str(candidate)).stem + '.tif'
+                    with rio.open(comp_map, 'w', **self.meta) as raster:
+                        raster.write(S_i, 1)
+        return results
+
+
+class SeriesComparison:
+    """ Compares the bands of two stacks of rasters (ex.: the timesteps of a morphodynamic simulation with those of
+    the observations) in a single vectorized pass over all the bands, with one membership kernel. A single band on
+    either side is compared with every band of the other one.
+
+                :param rasterA: string or list of strings, multi-band raster or single-band rasters of map A (see
+                    read_stack)
+                :param rasterB: string or list of strings, multi-band raster or single-band rasters of map B
+                :param neigh: integer, neighborhood being considered (number of cells from the central cell), default is 4
+                :param halving_distance: integer, distance (in cells) to which the membership decays to its half, default is 2
+                :param decay: string, distance decay function of the membership (see engines.DECAY_FUNCTIONS), default
+                    is 'exponential'
+                :param variable: string, optional, variable of NetCDF inputs
+    """
+
+    def __init__(self, rasterA, rasterB, neigh=4, halving_distance=2, decay='exponential', variable=None):
+        self.raster_A = rasterA
+        self.raster_B = rasterB
+        self.neigh = neigh
+        self.halving_distance = halving_distance
+        self.array_A, self.nodatavalue, self.meta_A, self.src_A, self.dtype_A, self.labels_A = read_stack(rasterA,
+                                                                                                         variable)
+        self.array_B, self.nodatavalue_B, self.meta_B, self.src_B, self.dtype_B, self.labels_B = read_stack(rasterB,
+                                                                                                           variable)
+
+        if halving_distance <= 0:
+            print('Halving distance must be at least 1')
+        if self.nodatavalue != self.nodatavalue_B:
+            print('Warning: Maps have different NoDataValues, I will use the NoDataValue of the first map')
+        if self.src_A != self.src_B:
+            sys.exit('MapError: Maps have different coordinate system')
+        if self.dtype_A != self.dtype_B:
+            print('Warning: Maps have different data types, I will use the datatype of the first map')
+        if self.array_A.shape[1:] != self.array_B.shape[1:]:
+            sys.exit('MapError: Maps have different shapes')
+        if len(self.labels_A) != len(self.labels_B) and 1 not in (len(self.labels_A), len(self.labels_B)):
+            sys.exit('MapError: Maps have different numbers of bands (' + str(len(self.labels_A)) + ' and ' +
+                     str(len(self.labels_B)) + ')')
+
+        # A single band is compared with every band of the other stack (broadcast, without copies of the values)
+        shape = (max(len(self.labels_A), len(self.labels_B)),) + self.array_A.shape[1:]
+        self.labels = self.labels_B if len(self.labels_B) == shape[0] else self.labels_A
+        self.array_A, self.array_B = [np.ma.array(np.broadcast_to(np.ma.getdata(array), shape),
+                                                  mask=np.broadcast_to(np.ma.getmaskarray(array), shape))
+                                      for array in (self.array_A, self.array_B)]
+        self.kernel = engines.get_kernel(self.neigh, self.halving_distance, decay)
+
+    def compare(self, method='numerical', comparison_name=None, save_dir=None, map_of_comparison=False):
+        """ Compares every pair of bands
+
+        :param method: string, 'numerical' (fuzzy numerical similarity) or 'rmse' (fuzzy RMSE)
+        :param comparison_name: string, optional, name of the table (*.csv) of results (and of the map of comparison)
+        :param save_dir: string, optional, directory where to save the results
+        :param map_of_comparison: boolean, if True saves the local measures of every band in a multi-band raster
+        :return: list of tuples (band label, global measure), np.array of the local measures of every band (filled
+            with the nodatavalue)
+        """
+        print('Performing fuzzy ' + method + ' comparison of ' + str(len(self.labels)) + ' bands...')
+        (s_AB, s_BA), = engines.sweep_two_way(self.array_A, self.array_B, [self.kernel], method, self.nodatavalue,
+                                              self.dtype_A)
+        S_i = local_measures(s_AB, s_BA, method)
+        del s_BA
+
+        # Overall measure of each band
+        S_i_ma = np.ma.masked_where(S_i == self.nodatavalue, S_i, copy=False)
+        series = S_i_ma.mean(axis=(1, 2))
+        if method == 'rmse':
+            series = series ** 0.5
+        results = list(zip(self.labels, np.ma.filled(series.astype(float), np.nan)))
+
+        # Save results
+        if comparison_name is not None and save_dir is not None:
+            name = comparison_name[:-4] if '.' in comparison_name[-4:] else comparison_name
+            with open(save_dir + '/' + name + '.csv', 'w') as table:
+                table.write('band,' + ('fuzzy_similarity' if method == 'numerical' else 'fuzzy_rmse') + '\n')
+                for label, S in results:
+                    table.write(str(label) + ',' + str(S) + '\n')
+            if map_of_comparison:
+                meta = dict(self.meta_A, count=len(self.labels), driver='GTiff')
+                with rio.open(save_dir + '/' + name + '.tif', 'w', **meta) as raster:
+                    raster.write(S_i)
+                    raster.descriptions = tuple(str(label) for label in self.labels)
+        return results, S_i
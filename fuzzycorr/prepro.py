@@ -9,11 +9,31 @@ try:
     import mapclassify.classifiers as mc
     from pathlib import Path
     from pyproj import CRS
-    from scipy import interpolate
+    import hashlib
+    import multiprocessing
+    from scipy import interpolate, spatial
+    from fuzzycorr import processes
 except ImportError:
     print('ModuleNotFoundError: Missing fundamental packages (required: geopandas, ogr, gdal, rasterio, numpy, pandas, '
         'alphashape, mapclassify, pathlib, pyproj, scipy and pykrige).')
 
+# Aggregates of the points falling in a cell (see grid_points)
+AGGREGATES = ('mean', 'median', 'min', 'max', 'count', 'std')
+
+# Binary formats of the points (see write_points), parquet and feather require pyarrow
+POINT_FORMATS = ('.npz', '.parquet', '.feather')
+
+# Number of layouts of valid cells whose interpolators are kept (see get_interpolator), 0 disables the cache, and bound
+# of their total size (bytes, triangulation and weights included as of their last use)
+INTERPOLATORS = 4
+INTERPOLATOR_BYTES = 2 ** 30
+_INTERPOLATORS = {}
+
+# Local (KD-tree) interpolation methods of norm_array, default search radius (cells) and rows of their blocks
+LOCAL_METHODS = ('idw', 'nearest_k', 'natural')
+LOCAL_RADIUS = 10
+LOCAL_ROWS = 256
+
 
 def clip_raster(polygon, in_raster, out_raster):
     """ Clips a raster based on the given polygon
@@ -27,6 +47,423 @@ def clip_raster(polygon, in_raster, out_raster):
     gdal.Warp(out_raster, in_raster, cutlineDSName=polygon)
 
 
+def write_points(df, points_file):
+    """ Saves the first three columns of a dataframe of points (x, y and the attribute) in a binary columnar format
+
+    :param df: pandas dataframe of the points
+    :param points_file: string, path of the file, its suffix gives the format (see POINT_FORMATS)
+    """
+    suffix = Path(points_file).suffix
+    if suffix not in POINT_FORMATS:
+        raise ValueError('Unknown format of points ' + str(suffix) + ', choose one of ' + str(POINT_FORMATS))
+    df = df.iloc[:, :3]
+    if suffix == '.npz':
+        np.savez(points_file, columns=np.array(df.columns, dtype=str),
+                 **{'column' + str(i): df.iloc[:, i].to_numpy() for i in range(3)})
+    elif suffix == '.parquet':
+        df.to_parquet(points_file, index=False)
+    else:
+        df.reset_index(drop=True).to_feather(points_file)
+
+
+def read_points(points_file):
+    """ Reads the points saved with write_points
+
+    :param points_file: string, path of the file (see POINT_FORMATS)
+    :return: pandas dataframe of the points (x, y and the attribute)
+    """
+    suffix = Path(points_file).suffix
+    if suffix == '.npz':
+        with np.load(points_file) as data:
+            return pd.DataFrame({name: data['column' + str(i)] for i, name in enumerate(data['columns'])})
+    if suffix == '.parquet':
+        return pd.read_parquet(points_file)
+    if suffix == '.feather':
+        return pd.read_feather(points_file)
+    raise ValueError('Unknown format of points ' + str(suffix) + ', choose one of ' + str(POINT_FORMATS))
+
+
+def convert_points(csv_file, points_file=None, **kwargs):
+    """ Converts a text file of points (x, y and the attribute in the first three columns) once to a binary columnar
+    file, which PreProFuzzy.from_points loads without parsing text; the conversion is done again only when the text
+    file is newer than the binary one
+
+    :param csv_file: string, path of the text file
+    :param points_file: string, optional, path of the binary file, default is csv_file with the suffix .npz
+    :param kwargs: other arguments of pandas.read_csv (ex.: sep, skip_blank_lines)
+    :return: string, path of the binary file
+    """
+    points_file = str(points_file or Path(csv_file).with_suffix('.npz'))
+    if not Path(points_file).exists() or Path(points_file).stat().st_mtime < Path(csv_file).stat().st_mtime:
+        df = pd.read_csv(csv_file, usecols=[0, 1, 2], **kwargs)
+        write_points(df.dropna(how='any', axis=0), points_file)
+        print('Points of ' + str(csv_file) + ' saved in ' + points_file)
+    return points_file
+
+
+def bin_index(values, low, high, bins):
+    """ Index of the equal bins between low and high containing each value, as np.histogram2d bins them: a value on an
+    edge goes to the upper bin, except high which goes to the last bin
+
+    :param values: np.array of floats
+    :param low: float, lower edge of the first bin
+    :param high: float, upper edge of the last bin
+    :param bins: integer, number of bins
+    :return: np.array (int) index of the bin, -1 for the values outside [low, high] (or nan)
+    """
+    edges = np.linspace(low, high, bins + 1)
+    inside = (values >= low) & (values <= high)  # nan excluded
+    values = values[inside]
+    found = np.minimum(((values - low) * (bins / (high - low))).astype(np.intp), bins - 1)
+    # Rounding of the scaled values, corrected against the edges
+    found[values < edges[found]] -= 1
+    found[(values >= edges[found + 1]) & (found < bins - 1)] += 1
+    index = np.full(inside.shape, -1, dtype=np.intp)
+    index[inside] = found
+    return index
+
+
+def grid_points(x, y, z, extent, nrow, ncol, aggregate='mean'):
+    """ Aggregates the values of scattered points in the cells of a grid in a single pass: each point gets the flat
+    index of its cell and the aggregates are accumulated with np.bincount (np.minimum.at and np.maximum.at for min
+    and max, runs of the points sorted by cell for median)
+
+    :param x: np.array of floats, x coordinates of the points
+    :param y: np.array of floats, y coordinates of the points
+    :param z: np.array of floats, values of the points
+    :param extent: tuple of floats (xmin, xmax, ymin, ymax), points outside of it are not used
+    :param nrow: integer, number of rows of the grid (the first row is the one of ymax)
+    :param ncol: integer, number of columns of the grid
+    :param aggregate: string, one of AGGREGATES, default is 'mean'
+    :return: np.array (float) of size nrow, ncol, nan in the cells without points
+    """
+    if aggregate not in AGGREGATES:
+        raise ValueError('Unknown aggregate ' + str(aggregate) + ', choose one of ' + str(AGGREGATES))
+    xmin, xmax, ymin, ymax = extent
+    col = bin_index(np.asarray(x, dtype=float), xmin, xmax, ncol)
+    row = bin_index(np.asarray(y, dtype=float), ymin, ymax, nrow)
+    inside = (col >= 0) & (row >= 0)
+    cell = (nrow - 1 - row[inside]) * ncol + col[inside]  # rows from ymax down
+    z = np.asarray(z, dtype=float)[inside]
+
+    size = nrow * ncol
+    counts = np.bincount(cell, minlength=size)
+    filled = counts > 0
+    grid = np.full(size, np.nan)
+    if aggregate == 'count':
+        grid[filled] = counts[filled]
+    elif aggregate in ('mean', 'std'):
+        np.divide(np.bincount(cell, weights=z, minlength=size), counts, out=grid, where=filled)
+        if aggregate == 'std':
+            # Population standard deviation, from the deviations to the mean of each cell
+            squares = np.bincount(cell, weights=(z - grid[cell]) ** 2, minlength=size)
+            np.sqrt(np.divide(squares, counts, out=grid, where=filled), out=grid)
+    elif aggregate in ('min', 'max'):
+        extreme = np.minimum if aggregate == 'min' else np.maximum
+        grid[filled] = np.inf if aggregate == 'min' else -np.inf
+        extreme.at(grid, cell, z)
+    else:
+        # Points sorted by value, then (stable) by cell: each cell is a run of sorted values
+        order = np.argsort(z)
+        z = z[order[np.argsort(cell[order], kind='stable')]]
+        starts = np.concatenate(([0], np.cumsum(counts[filled])[:-1]))
+        grid[filled] = (z[starts + (counts[filled] - 1) // 2] + z[starts + counts[filled] // 2]) / 2
+    return grid.reshape(nrow, ncol)
+
+
+class GridInterpolator:
+    """ Interpolation of scattered points onto target points, as scipy.interpolate.griddata does, for any number of
+    sets of values on the same points: the Delaunay triangulation is built once, and so are the simplices and
+    barycentric weights of the targets (linear) and their nearest points (nearest). Use get_interpolator to obtain a
+    cached instance for a layout of valid grid cells, or from_grid for an instance held by the caller.
+
+    :param points: np.array (float) of shape (npoints, 2), coordinates of the points holding values
+    :param targets: np.array (float) of shape (ntargets, 2), coordinates of the interpolated points
+    """
+
+    def __init__(self, points, targets):
+        self.points = points
+        self.targets = targets
+        self._tri = None
+        self._linear = None
+        self._nearest = None
+
+    @classmethod
+    def from_grid(cls, valid):
+        """ Interpolator from the valid cells of a grid to all its cells (points at the column and row indices of the
+        cells)
+
+        :param valid: np.array of booleans of size nrow, ncol, cells holding values
+        :return: GridInterpolator
+        """
+        rows, cols = np.nonzero(valid)
+        yy, xx = np.indices(valid.shape)
+        return cls(np.column_stack((cols, rows)).astype(float), np.column_stack((xx.ravel(), yy.ravel())).astype(float))
+
+    @property
+    def nbytes(self):
+        """ Memory held by the points, the targets and what was built from them so far (bytes) """
+        arrays = [self.points, self.targets]
+        if self._tri is not None:
+            arrays += [self._tri.points, self._tri.simplices, self._tri.neighbors, self._tri.equations]
+        if self._linear is not None:
+            arrays += list(self._linear) + [self._tri.transform]
+        if self._nearest is not None:
+            arrays.append(self._nearest)
+        return sum(array.nbytes for array in arrays)
+
+    @property
+    def tri(self):
+        """ Delaunay triangulation of the points, built on first use """
+        if self._tri is None:
+            self._tri = spatial.Delaunay(self.points)
+        return self._tri
+
+    def linear_weights(self):
+        """ Simplices and barycentric weights of the targets, computed on first use
+
+        :return: np.array (bool) targets inside the triangulation, np.array (int) vertices of their simplices,
+            np.array (float) barycentric weights of the vertices
+        """
+        if self._linear is None:
+            simplex = self.tri.find_simplex(self.targets)
+            inside = simplex >= 0
+            transform = self.tri.transform[simplex[inside]]
+            weights = np.einsum('ijk,ik->ij', transform[:, :2], self.targets[inside] - transform[:, 2])
+            weights = np.column_stack((weights, 1 - weights.sum(axis=1)))
+            self._linear = inside, self.tri.simplices[simplex[inside]], weights
+        return self._linear
+
+    def __call__(self, values, method='linear', fill_value=np.nan):
+        """ Interpolates a set of values of the points
+
+        :param values: np.array (float), values of the points
+        :param method: string, 'linear', 'cubic' or 'nearest' (see scipy.interpolate.griddata)
+        :param fill_value: float, value of the targets outside the convex hull of the points (linear and cubic)
+        :return: np.array (float) values of the targets
+        """
+        values = np.asarray(values, dtype=float)
+        if method == 'linear':
+            inside, vertices, weights = self.linear_weights()
+            out = np.full(len(self.targets), fill_value, dtype=float)
+            out[inside] = np.einsum('ij,ij->i', values[vertices], weights)
+            return out
+        if method == 'cubic':
+            # The gradients depend on the values, only the triangulation is shared
+            return interpolate.CloughTocher2DInterpolator(self.tri, values, fill_value=fill_value)(self.targets)
+        if method == 'nearest':
+            if self._nearest is None:
+                self._nearest = spatial.cKDTree(self.points).query(self.targets)[1]
+            return values[self._nearest]
+        raise ValueError('Unknown interpolation method ' + str(method) + ", choose 'linear', 'cubic' or 'nearest'")
+
+
+def get_interpolator(valid):
+    """ Returns the cached GridInterpolator from the valid cells of a grid to all its cells (see
+    GridInterpolator.from_grid), building it if the layout of valid cells is new; the INTERPOLATORS most recently used
+    layouts are kept, as long as their total size stays under INTERPOLATOR_BYTES (see clear_interpolators)
+
+    :param valid: np.array of booleans of size nrow, ncol, cells holding values
+    :return: GridInterpolator
+    """
+    key = (valid.shape, hashlib.blake2b(np.packbits(valid).tobytes(), digest_size=20).hexdigest())
+    interpolator = _INTERPOLATORS.pop(key, None)
+    if interpolator is None:
+        interpolator = GridInterpolator.from_grid(valid)
+
+    # Least recently used first, the returned interpolator is the most recently used
+    _INTERPOLATORS[key] = interpolator
+    size = sum(cached.nbytes for cached in _INTERPOLATORS.values())
+    while _INTERPOLATORS and (len(_INTERPOLATORS) > INTERPOLATORS or size > INTERPOLATOR_BYTES):
+        size -= _INTERPOLATORS.pop(next(iter(_INTERPOLATORS))).nbytes
+    return interpolator
+
+
+def clear_interpolators():
+    """ Releases the cached interpolators (see get_interpolator)
+
+    :return: integer, number of released interpolators
+    """
+    released = len(_INTERPOLATORS)
+    _INTERPOLATORS.clear()
+    return released
+
+
+def _local_rows(rows):
+    """ Local interpolation of a block of rows (row_start, row_stop) of the grid, with the KD-tree and the values of
+    the points kept in the worker process (see local_interpolation and processes.init_worker) """
+    tree, values, (nrow, ncol), method, radius, k, power, fill_value = processes.worker_state()
+    row_start, row_stop = rows
+    if method == 'natural':
+        # Discrete Sibson interpolation: every cell spreads the value of its nearest point to the cells strictly closer
+        # to it than that point (so a tie between two nearest points never pulls the value of the other one in, and a
+        # cell holding a point, at distance 0, keeps its value), the rows of the block get the spreads of the cells up
+        # to radius rows away
+        reach = int(np.floor(radius))
+        halo_start, halo_stop = max(0, row_start - reach), min(nrow, row_stop + reach)
+        yy, xx = np.mgrid[halo_start:halo_stop, 0:ncol]
+        distance, index = tree.query(np.column_stack((yy.ravel(), xx.ravel())), distance_upper_bound=radius)
+        pad = ((reach - (row_start - halo_start), reach - (halo_stop - row_stop)), (reach, reach))
+        spread = np.pad(np.where(np.isfinite(distance), distance, -1).reshape(yy.shape), pad, constant_values=-1)
+        nearest = np.pad(values[np.minimum(index, len(values) - 1)].reshape(yy.shape), pad)
+        shape = (row_stop - row_start, ncol)
+        sums, counts = np.zeros(shape), np.zeros(shape)
+        for di in range(-reach, reach + 1):
+            for dj in range(-reach, reach + 1):
+                offset = np.hypot(di, dj)
+                if offset > radius:
+                    continue
+                rows_s = slice(reach + di, reach + di + shape[0])
+                cols_s = slice(reach + dj, reach + dj + shape[1])
+                reached = spread[rows_s, cols_s] > offset
+                sums += np.where(reached, nearest[rows_s, cols_s], 0)
+                counts += reached
+        out = np.full(shape, fill_value, dtype=float)
+        centre = (slice(reach, reach + shape[0]), slice(reach, reach + shape[1]))
+        found = spread[centre] > 0  # a point within radius of the cell, which spreads at least to itself
+        out[found] = sums[found] / counts[found]
+        data = spread[centre] == 0
+        out[data] = nearest[centre][data]
+        return out
+
+    yy, xx = np.mgrid[row_start:row_stop, 0:ncol]
+    distance, index = tree.query(np.column_stack((yy.ravel(), xx.ravel())), k=k, distance_upper_bound=radius)
+    distance, index = distance.reshape(yy.size, k), index.reshape(yy.size, k)
+    found = np.isfinite(distance)
+    neighbours = values[np.minimum(index, len(values) - 1)]  # index is the number of points where none was found
+    if method == 'nearest_k':
+        weights = found.astype(float)
+    else:
+        with np.errstate(divide='ignore'):
+            weights = np.where(found, 1 / distance ** power, 0)
+        exact = distance[:, 0] == 0  # cells holding a point keep its value
+        weights[exact] = distance[exact] == 0
+    total = weights.sum(axis=1)
+    out = np.full(yy.size, fill_value, dtype=float)
+    np.divide((weights * neighbours).sum(axis=1), total, out=out, where=total > 0)
+    return out.reshape(yy.shape)
+
+
+def local_interpolation(array, method='idw', radius=LOCAL_RADIUS, k=8, power=2, fill_value=np.nan,
+                        block_rows=LOCAL_ROWS, workers=1):
+    """ Interpolates the valid cells of a grid to all its cells from the points within a search radius only (found
+    with a KD-tree of the valid cells), block of rows by block of rows, so that time and memory grow with the size of
+    the grid instead of the number of point pairs; the cells farther than radius from every valid cell get fill_value
+
+    :param array: np.ma.array (float) of size nrow, ncol, masked where the cells have no value
+    :param method: string, 'idw' (inverse distance weighting of the k nearest points), 'nearest_k' (mean of the k
+        nearest points) or 'natural' (discrete Sibson approximation of natural neighbour interpolation), default 'idw'
+    :param radius: float, search radius (cells), default is LOCAL_RADIUS
+    :param k: integer, number of nearest points of 'idw' and 'nearest_k', default is 8
+    :param power: float, power of the inverse distance of 'idw', default is 2
+    :param fill_value: float, value of the cells without a point within radius
+    :param block_rows: integer, rows of the blocks, default is LOCAL_ROWS
+    :param workers: integer, number of processes sharing the blocks, default is 1
+    :return: np.array (float) of size nrow, ncol
+    """
+    if method not in LOCAL_METHODS:
+        raise ValueError('Unknown local interpolation method ' + str(method) + ', choose one of ' + str(LOCAL_METHODS))
+    array = np.ma.masked_invalid(array)
+    valid = ~np.ma.getmaskarray(array)
+    local = (spatial.cKDTree(np.column_stack(np.nonzero(valid))), array.compressed().astype(float), valid.shape,
+             method, radius, k, power, fill_value)
+    blocks = [(row, min(row + block_rows, valid.shape[0])) for row in range(0, valid.shape[0], block_rows)]
+    if workers > 1:
+        with multiprocessing.Pool(workers, initializer=processes.init_worker, initargs=(local,)) as pool:
+            return np.concatenate(pool.map(_local_rows, blocks))
+    processes.init_worker(local)
+    return np.concatenate([_local_rows(block) for block in blocks])
+
+
+class GridAccumulator:
+    """ Per-cell aggregates of points added chunk by chunk (streaming counterpart of grid_points): the counts and sums
+    of the values, and if requested the sums of squared deviations (std) and the extremes (min, max)
+
+    :param extent: tuple of floats (xmin, xmax, ymin, ymax), points outside of it are not used
+    :param nrow: integer, number of rows of the grid (the first row is the one of ymax)
+    :param ncol: integer, number of columns of the grid
+    :param aggregates: tuple of strings, aggregates besides 'mean' and 'count' to accumulate ('std', 'min', 'max'),
+        the median cannot be accumulated chunk by chunk
+    """
+
+    def __init__(self, extent, nrow, ncol, aggregates=()):
+        if 'median' in aggregates:
+            raise ValueError('The median of the cells cannot be accumulated chunk by chunk, load the points in a '
+                             'DataFrame (PreProFuzzy) instead')
+        if not set(aggregates) <= set(AGGREGATES):
+            raise ValueError('Unknown aggregates ' + str(aggregates) + ', choose among ' + str(AGGREGATES))
+        self.extent = extent
+        self.nrow = nrow
+        self.ncol = ncol
+        size = nrow * ncol
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.sums = np.zeros(size)
+        self.squares = np.zeros(size) if 'std' in aggregates else None
+        self.min = np.full(size, np.inf) if 'min' in aggregates else None
+        self.max = np.full(size, -np.inf) if 'max' in aggregates else None
+        self.points = 0
+        self.zmin, self.zmax = np.inf, -np.inf
+
+    def add(self, x, y, z):
+        """ Adds a chunk of points
+
+        :param x: np.array of floats, x coordinates of the points
+        :param y: np.array of floats, y coordinates of the points
+        :param z: np.array of floats, values of the points
+        """
+        xmin, xmax, ymin, ymax = self.extent
+        col = bin_index(np.asarray(x, dtype=float), xmin, xmax, self.ncol)
+        row = bin_index(np.asarray(y, dtype=float), ymin, ymax, self.nrow)
+        inside = (col >= 0) & (row >= 0)
+        cell = (self.nrow - 1 - row[inside]) * self.ncol + col[inside]  # rows from ymax down
+        z = np.asarray(z, dtype=float)[inside]
+        if not z.size:
+            return
+
+        # Aggregates of the chunk over the cells it touches only, so the cost follows the points and not the grid
+        cells, inverse = np.unique(cell, return_inverse=True)
+        inverse = inverse.ravel()
+        counts = np.bincount(inverse)
+        sums = np.bincount(inverse, weights=z)
+        if self.squares is not None:
+            # Sums of squared deviations of the chunk, merged with the ones of the previous chunks (Chan et al.)
+            previous = self.counts[cells]
+            means = sums / counts
+            delta = means - np.divide(self.sums[cells], previous, out=np.zeros(cells.size), where=previous > 0)
+            self.squares[cells] += np.bincount(inverse, weights=(z - means[inverse]) ** 2)
+            self.squares[cells] += delta ** 2 * previous * counts / (previous + counts)
+        self.counts[cells] += counts
+        self.sums[cells] += sums
+        if self.min is not None:
+            np.minimum.at(self.min, cell, z)
+        if self.max is not None:
+            np.maximum.at(self.max, cell, z)
+        self.points += z.size
+        self.zmin, self.zmax = min(self.zmin, z.min()), max(self.zmax, z.max())
+
+    def grid(self, aggregate='mean'):
+        """ Aggregate of the points added so far
+
+        :param aggregate: string, 'mean', 'count' or one of the aggregates accumulated
+        :return: np.array (float) of size nrow, ncol, nan in the cells without points
+        """
+        accumulated = {'std': self.squares, 'min': self.min, 'max': self.max}
+        if aggregate not in ('mean', 'count') and accumulated.get(aggregate) is None:
+            raise ValueError('The aggregate ' + str(aggregate) + ' was not accumulated chunk by chunk (see aggregates '
+                             'of GridAccumulator)')
+        filled = self.counts > 0
+        grid = np.full(self.nrow * self.ncol, np.nan)
+        if aggregate == 'count':
+            grid[filled] = self.counts[filled]
+        elif aggregate == 'mean':
+            grid[filled] = self.sums[filled] / self.counts[filled]
+        elif aggregate == 'std':
+            grid[filled] = np.sqrt(self.squares[filled] / self.counts[filled])
+        else:
+            grid[filled] = accumulated[aggregate][filled]
+        return grid.reshape(self.nrow, self.ncol)
+
+
 class PreProFuzzy:
     """Parent pre-processing structure for the comparison of numeric maps
 
@@ -37,6 +474,9 @@ class PreProFuzzy:
     :param res: float, resolution of the cell (cell size), is the same for x and y
     :param ulc: tuple of floats, upper left corner coordinate, optional
     :param lrc: tuple of floats, lower right corner coordinate, optional
+
+    Large point clouds can be streamed instead with from_csv (or from_chunks), which grids the points chunk by chunk
+    without keeping them in memory.
     """
 
     def __init__(self, df, attribute, crs, nodatavalue, res=None, ulc=(np.nan, np.nan),
@@ -55,28 +495,101 @@ class PreProFuzzy:
         new_names = {df.columns[0]: 'x', df.columns[1]: 'y', df.columns[2]: self.attribute}
         self.df = df.rename(columns=new_names)
 
-        # Create geodataframe from the dataframe
-        gdf = geopandas.GeoDataFrame(self.df, geometry=geopandas.points_from_xy(self.df.x, self.df.y))
-        gdf.crs = self.crs
-        self.gdf = gdf
-        self.x = gdf.geometry.x.values
-        self.y = gdf.geometry.y.values
-        self.z = gdf[attribute].values
-
-        if np.isfinite(ulc[0]) and np.isfinite(lrc[0]):
-            self.xmax = lrc[0]
-            self.xmin = ulc[0]
-            self.ymax = ulc[1]
-            self.ymin = lrc[1]
-        else:
-            self.xmax = self.gdf.geometry.x.max()
-            self.xmin = self.gdf.geometry.x.min()
-            self.ymax = self.gdf.geometry.y.max()
-            self.ymin = self.gdf.geometry.y.min()
+        # Coordinates and values, the geodataframe is only built when needed (see gdf)
+        self.x = self.df.x.values
+        self.y = self.df.y.values
+        self.z = self.df[attribute].values
+        self._gdf = None
+        self.accumulator = None
+
+        if not (np.isfinite(ulc[0]) and np.isfinite(lrc[0])):
+            ulc, lrc = (self.x.min(), self.y.max()), (self.x.max(), self.y.min())
+        self._set_grid(ulc, lrc, res)
+
+    @classmethod
+    def from_chunks(cls, read_chunks, attribute, crs, nodatavalue, res=None, ulc=(np.nan, np.nan),
+                    lrc=(np.nan, np.nan), aggregates=()):
+        """ Grids the points of a large survey chunk by chunk, keeping only the per-cell aggregates (GridAccumulator)
+        in memory instead of the points
+
+        :param read_chunks: callable returning an iterable of pandas dataframes (ex.: pandas.read_csv with chunksize),
+            with x, y and the attribute in their first three columns; called twice if ulc and lrc are not given, the
+            first pass finding the extent of the points
+        :param aggregates: tuple of strings, aggregates besides 'mean' and 'count' available to points_to_grid
+            ('std', 'min', 'max')
+        :return: PreProFuzzy without the points (df, x, y and z are None)
+        """
+        if not isinstance(attribute, str):
+            print("ERROR: attribute must be a string, check the name on your textfile")
+
+        instance = cls.__new__(cls)
+        instance.crs = CRS(crs)
+        instance.attribute = attribute
+        instance.nodatavalue = nodatavalue
+        instance.df, instance.x, instance.y, instance.z, instance._gdf = None, None, None, None, None
+
+        if not (np.isfinite(ulc[0]) and np.isfinite(lrc[0])):
+            xmin, xmax, ymin, ymax = np.inf, -np.inf, np.inf, -np.inf
+            for chunk in read_chunks():
+                chunk = chunk.iloc[:, :3].dropna(how='any')
+                xmin, xmax = min(xmin, chunk.iloc[:, 0].min()), max(xmax, chunk.iloc[:, 0].max())
+                ymin, ymax = min(ymin, chunk.iloc[:, 1].min()), max(ymax, chunk.iloc[:, 1].max())
+            ulc, lrc = (xmin, ymax), (xmax, ymin)
+        instance._set_grid(ulc, lrc, res)
+
+        instance.accumulator = GridAccumulator(instance.extent, instance.nrow, instance.ncol, aggregates)
+        for chunk in read_chunks():
+            chunk = chunk.iloc[:, :3].dropna(how='any')
+            instance.accumulator.add(*(chunk.iloc[:, column].to_numpy(dtype=float) for column in range(3)))
+        print('Number of points gridded: ', instance.accumulator.points)
+        return instance
+
+    @classmethod
+    def from_points(cls, points_file, attribute, crs, nodatavalue, res=None, ulc=(np.nan, np.nan),
+                    lrc=(np.nan, np.nan)):
+        """ Loads the points from a binary columnar file (see convert_points and save_points)
+
+        :param points_file: string, path of the file (see POINT_FORMATS)
+        :return: PreProFuzzy
+        """
+        return cls(read_points(points_file), attribute, crs, nodatavalue, res, ulc, lrc)
+
+    def save_points(self, points_file):
+        """ Saves the standardized points (x, y and the attribute) in a binary columnar file, to be loaded again with
+        from_points
+
+        :param points_file: string, path of the file, its suffix gives the format (see POINT_FORMATS)
+        """
+        if self.df is None:
+            raise ValueError('The points of a streamed PreProFuzzy (from_chunks) are not kept, they cannot be saved')
+        write_points(self.df[['x', 'y', self.attribute]], points_file)
+
+    @classmethod
+    def from_csv(cls, csv_file, attribute, crs, nodatavalue, res=None, ulc=(np.nan, np.nan), lrc=(np.nan, np.nan),
+                 aggregates=(), chunksize=10 ** 6, **kwargs):
+        """ Streams a delimited text file of points (x, y and the attribute in the first three columns) in chunks of
+        chunksize rows (see from_chunks)
+
+        :param csv_file: string, path of the file
+        :param chunksize: integer, number of rows read at once, default is 10 ** 6
+        :param kwargs: other arguments of pandas.read_csv (ex.: sep, skip_blank_lines)
+        :return: PreProFuzzy without the points (df, x, y and z are None)
+        """
+        def read_chunks():
+            return pd.read_csv(csv_file, usecols=[0, 1, 2], chunksize=chunksize, **kwargs)
+
+        return cls.from_chunks(read_chunks, attribute, crs, nodatavalue, res, ulc, lrc, aggregates)
+
+    def _set_grid(self, ulc, lrc, res):
+        """ Sets the extent, the resolution and the size of the grid """
+        self.xmax = lrc[0]
+        self.xmin = ulc[0]
+        self.ymax = ulc[1]
+        self.ymin = lrc[1]
 
         self.extent = (self.xmin, self.xmax, self.ymin, self.ymax)
 
-        if np.isfinite(res):
+        if res is not None and np.isfinite(res):
             self.res = res
         else:
             # if res not passed, then res will be the distance between xmin and xmax / 1000
@@ -85,50 +598,78 @@ class PreProFuzzy:
         self.ncol = int(np.ceil((self.xmax - self.xmin) / self.res))  # delx
         self.nrow = int(np.ceil((self.ymax - self.ymin) / self.res))  # dely
 
-    def points_to_grid(self):
+    @property
+    def gdf(self):
+        """ Geodataframe of the points, built on first use (ex.: by create_polygon); without the points (from_chunks)
+        its points are the centres of the cells holding data, with the mean of the cell
+        """
+        if self._gdf is None:
+            if self.df is not None:
+                gdf = geopandas.GeoDataFrame(self.df, geometry=geopandas.points_from_xy(self.df.x, self.df.y))
+            else:
+                cells = np.flatnonzero(self.accumulator.counts)
+                rows, cols = np.divmod(cells, self.ncol)
+                x = self.xmin + (cols + 0.5) * (self.xmax - self.xmin) / self.ncol
+                y = self.ymax - (rows + 0.5) * (self.ymax - self.ymin) / self.nrow
+                gdf = geopandas.GeoDataFrame({'x': x, 'y': y, self.attribute: self.accumulator.grid().ravel()[cells]},
+                                             geometry=geopandas.points_from_xy(x, y))
+            gdf.crs = self.crs
+            self._gdf = gdf
+        return self._gdf
+
+    def points_to_grid(self, aggregate='mean'):
         """Creates a grid of new points in the target resolution
 
-        :returns: array of size nrow, ncol
+        :param aggregate: string, aggregate of the points falling in each cell (see AGGREGATES), default is 'mean'
+        :returns: array of size nrow, ncol (first row at ymax), nan in the cells without points
 
         Hints:
             Read more at http://chris35wills.github.io/gridding_data/
         """
-        hrange = ((self.ymin, self.ymax),
-                  (self.xmin, self.xmax))  # any points outside of this will be condisdered outliers and not used
-
-        zi, yi, xi = np.histogram2d(self.y, self.x, bins=(int(self.nrow), int(self.ncol)), weights=self.z, normed=False,
-                                    range=hrange)
-        counts, _, _ = np.histogram2d(self.y, self.x, bins=(int(self.nrow), int(self.ncol)), range=hrange)
-        np.seterr(divide='ignore', invalid='ignore')  # ignores errors if dividing by zero
-        zi = np.divide(zi, counts)
-        np.seterr(divide=None, invalid=None)  # set it back now
-        zi = np.ma.masked_invalid(zi)
-        array = np.flipud(np.array(zi))  # flips each column upside down
-
-        return array
+        if self.accumulator is not None:
+            return self.accumulator.grid(aggregate)
+        # any points outside of the extent will be considered outliers and not used
+        return grid_points(self.x, self.y, self.z, self.extent, int(self.nrow), int(self.ncol), aggregate)
 
-    def norm_array(self, method='linear'):
+    def norm_array(self, method='linear', aggregate='mean', radius=LOCAL_RADIUS, workers=1, interpolator=None,
+                   **kwargs):
         """ Normalizes the raw data in equally distanced points depending on the selected resolution
 
+        :param method: string, 'linear', 'cubic' or 'nearest' (global interpolation of all the valid cells, see
+            scipy.interpolate.griddata), or 'idw', 'nearest_k' or 'natural' (local interpolation of the valid cells
+            within radius, block by block, see local_interpolation), default is 'linear'
+        :param aggregate: string, aggregate of the points falling in each cell (see points_to_grid), default is 'mean'
+        :param radius: float, search radius (cells) of the local methods, the cells farther from every valid cell
+            get the nodatavalue, default is LOCAL_RADIUS
+        :param workers: integer, number of processes sharing the blocks of rows of the local methods, default is 1
+        :param interpolator: GridInterpolator, optional, interpolator of the global methods held by the caller (see
+            GridInterpolator.from_grid), built for the valid cells of the grid; default is the cached one of
+            get_interpolator
+        :param kwargs: other arguments of local_interpolation (k, power, block_rows)
         :returns: interpolated and normalized array with selected resolution
 
         Hint:
             Read more at https://github.com/rosskush/skspatial
+            The triangulation of the valid cells is cached (see get_interpolator): grids sharing the same layout of
+            valid cells (ex.: attributes or simulation outputs of the same mesh) reuse it. Set INTERPOLATORS to 0
+            (or pass an interpolator) to keep it out of the cache, or release it with clear_interpolators
         """
-        array = self.points_to_grid()
-        x = np.arange(0, self.ncol)  # creates 1d array with values [0, ncol[
-        y = np.arange(0, self.nrow)
+        array = self.points_to_grid(aggregate)
 
         # mask invalid values
         array = np.ma.masked_invalid(array)  # all invalid values are masked (ex.: np.inf or np.nan)
-        xx, yy = np.meshgrid(x, y)  # creates a grid of values with (x,y) based on the x and y provided
 
-        # get only the valid values
-        x1 = xx[~array.mask]  # takes only unmasked points
-        y1 = yy[~array.mask]
-        newarr = array[~array.mask]
+        if method in LOCAL_METHODS:
+            return local_interpolation(array, method, radius, fill_value=self.nodatavalue, workers=workers, **kwargs)
 
-        out_array = interpolate.griddata((x1, y1), newarr.ravel(), (xx, yy), method=method, fill_value=self.nodatavalue)
+        # interpolate the valid values (column and row of the cells as coordinates) to every cell
+        valid = ~np.ma.getmaskarray(array)
+        if interpolator is None:
+            interpolator = get_interpolator(valid)
+        elif len(interpolator.points) != np.count_nonzero(valid) or len(interpolator.targets) != valid.size:
+            raise ValueError('The interpolator was not built for the valid cells of this grid (see '
+                             'GridInterpolator.from_grid)')
+        out_array = interpolator(array.compressed(), method, self.nodatavalue).reshape(self.nrow, self.ncol)
 
         return out_array
 
@@ -140,7 +681,9 @@ class PreProFuzzy:
         :returns: array of random values within a range of the same size and chape as the original
         """
 
-        if kwargs['minmax'] is None:
+        if kwargs['minmax'] is None and self.z is None:
+            zmin, zmax = self.accumulator.zmin, self.accumulator.zmax
+        elif kwargs['minmax'] is None:
             zmin, zmax = self.z.min(), self.z.max()
         else:
             zmin, zmax = kwargs['minmax']
@@ -0,0 +1,20 @@
+# State of the worker processes of a pool (see init_worker), sent once instead of with every task
+_WORKER_STATE = None
+
+
+def init_worker(state):
+    """ Keeps the state shared by the tasks of a pool in the worker process (initializer of multiprocessing.Pool,
+    or called directly before running the tasks in the current process)
+
+    :param state: object, state of the tasks (ex.: a comparison and its rasters, a KD-tree and the values of its points)
+    """
+    global _WORKER_STATE
+    _WORKER_STATE = state
+
+
+def worker_state():
+    """ Returns the state kept by init_worker in the current process
+
+    :return: object, state of the tasks
+    """
+    return _WORKER_STATE
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import rasterio as rio
+from rasterio.transform import from_origin
+
+NODATA = -9999
+
+
+def write_raster(path, array, nodata=NODATA):
+    """ Writes a single band GeoTIFF in the coordinate system of the Salzach case
+
+    :return: string, path of the raster
+    """
+    path = str(path)
+    with rio.open(path, 'w', driver='GTiff', height=array.shape[0], width=array.shape[1], count=1,
+                  dtype=str(array.dtype), crs='EPSG:5684', transform=from_origin(0, 0, 5, 5), nodata=nodata) as dst:
+        dst.write(array, 1)
+    return path
+
+
+def fixture_arrays(shape=(36, 30), seed=0, nan=False):
+    """ Map A and map B = A + noise, with a nodata border, scattered nodata cells (not the same in both maps), cells
+    where both maps are 0 (0/0 similarity) and cells where only one of them is 0
+
+    :param nan: boolean, if True a valid cell of each map holds nan (not the nodatavalue, so it is compared)
+    :return: np.array map A, np.array map B (float32)
+    """
+    rng = np.random.RandomState(seed)
+    array_A = rng.normal(0, 1, shape).astype('float32')
+    array_B = (array_A + rng.normal(0, 0.3, shape)).astype('float32')
+    zeros = rng.random_sample(shape) < 0.05
+    array_A[zeros] = 0
+    array_B[zeros] = 0
+    array_A[rng.random_sample(shape) < 0.03] = 0
+    for array in (array_A, array_B):
+        array[rng.random_sample(shape) < 0.2] = NODATA
+        array[:3, :] = NODATA
+    if nan:
+        array_A[20, 15] = np.nan
+        array_B[8, 24] = np.nan
+    return array_A, array_B
+
+
+@pytest.fixture(scope='session', params=[False, True], ids=['finite', 'nan'])
+def nan(request):
+    """ Whether the fixture rasters hold nan-valued cells (see fixture_arrays) """
+    return request.param
+
+
+@pytest.fixture(scope='session')
+def rasters(tmp_path_factory, nan):
+    """ Paths of the fixture rasters A and B (see fixture_arrays) """
+    raster_dir = tmp_path_factory.mktemp('rasters')
+    array_A, array_B = fixture_arrays(nan=nan)
+    return write_raster(raster_dir / 'A.tif', array_A), write_raster(raster_dir / 'B.tif', array_B)
@@ -0,0 +1,26 @@
+""" The result cache only reads and removes its own entries """
+import numpy as np
+
+from fuzzycorr.cache import ResultCache
+
+
+def test_cache_keeps_foreign_files(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    cache = ResultCache(cache_dir, max_entries=2)
+    foreign = cache_dir / 'foreign.npz'
+    np.savez(foreign, values=np.arange(3))
+    raster = tmp_path / 'A.tif'
+    raster.write_bytes(b'raster')
+
+    keys = [cache.key(('A', 'B'), neigh=neigh) for neigh in range(3)]
+    for key in keys:
+        cache.put(key, 0.5, np.ones((2, 2)), (raster,))
+    assert cache.get(keys[0]) is None  # evicted, least recently used
+    assert cache.get(keys[2])[0] == 0.5
+    assert len(cache.entries()) == 2
+
+    assert cache.invalidate(raster=raster) == 2
+    cache.put(keys[0], 0.5, np.ones((2, 2)))
+    assert cache.clear() == 1
+    assert foreign.exists()
+    assert sorted(path.name for path in cache_dir.iterdir()) == ['foreign.npz']
@@ -0,0 +1,169 @@
+""" The engines, tiles, workers, sweep and update give the local and global measures of the cell loop """
+import json
+import os
+
+import numpy as np
+import pytest
+import rasterio as rio
+
+from fuzzycorr import engines, fuzzycomp as fuzz
+from conftest import NODATA, fixture_arrays, write_raster
+
+NEIGH, HALVING_DISTANCE = 3, 2
+METHODS = ('numerical', 'rmse')
+
+
+def compare(raster_A, raster_B, save_dir, method, neigh=NEIGH, halving_distance=HALVING_DISTANCE, **kwargs):
+    """ Runs fuzzy_numerical or fuzzy_rmse and reads back its map of comparison
+
+    :return: global measure, np.array map of comparison
+    """
+    comparison = fuzz.FuzzyComparison(raster_A, raster_B, neigh, halving_distance, **kwargs)
+    compare_maps = comparison.fuzzy_numerical if method == 'numerical' else comparison.fuzzy_rmse
+    S = compare_maps('comparison', str(save_dir))
+    with rio.open(str(save_dir / 'comparison.tif')) as src:
+        return S, src.read(1)
+
+
+@pytest.fixture(scope='module')
+def loop(rasters, tmp_path_factory):
+    """ Global measure and map of comparison of the cell loop, for each method """
+    return {method: compare(*rasters, tmp_path_factory.mktemp('loop'), method, engine='loop') for method in METHODS}
+
+
+def test_fixture_has_zero_over_zero_and_nan_cells(rasters, nan):
+    array_A, array_B = fixture_arrays(nan=nan)
+    assert np.any((array_A == 0) & (array_B == 0))
+    assert np.any((array_A == 0) & (array_B != 0) & (array_B != NODATA))
+    assert np.isnan(array_A).any() == np.isnan(array_B).any() == nan
+
+
+@pytest.mark.parametrize('method', METHODS)
+@pytest.mark.parametrize('options', [{'engine': 'vectorized'}, {'engine': 'ring'},
+                                     {'workers': 2}, {'memory_map': True}],
+                         ids=['vectorized', 'ring', 'workers', 'memory_map'])
+def test_in_memory_engines_match_loop(rasters, loop, tmp_path, method, options):
+    if options.get('memory_map'):
+        options = dict(options, sidecar_dir=str(tmp_path))
+    S, S_i = compare(*rasters, tmp_path, method, **options)
+    np.testing.assert_equal(S, loop[method][0])  # nan if a map holds nan values
+    np.testing.assert_array_equal(S_i, loop[method][1])
+
+
+@pytest.mark.parametrize('method', METHODS)
+@pytest.mark.parametrize('workers', [1, 2])
+def test_tiled_matches_loop(rasters, loop, tmp_path, method, workers):
+    S, S_i = compare(*rasters, tmp_path, method, tile_size=8, workers=workers)
+    # The global measure is accumulated tile by tile in double precision
+    assert S == pytest.approx(loop[method][0], rel=1e-6, nan_ok=True)
+    np.testing.assert_array_equal(S_i, loop[method][1])
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_sweep_matches_loop(rasters, tmp_path, method):
+    comparison = fuzz.FuzzyComparison(*rasters, NEIGH, HALVING_DISTANCE)
+    for neigh, halving_distance, S in comparison.sweep([1, 3], [1, 2], method):
+        np.testing.assert_equal(S, compare(*rasters, tmp_path, method, neigh, halving_distance, engine='loop')[0])
+
+
+@pytest.mark.parametrize('method', METHODS)
+@pytest.mark.parametrize('changed', [None, (10, 14, 5, 12)], ids=['detected', 'window'])
+def test_update_matches_loop(rasters, nan, tmp_path, method, changed):
+    array_B = fixture_arrays(nan=nan)[1]
+    array_B[10:14, 5:12] += 0.5
+    array_B[11, 6] = NODATA
+    edited = write_raster(tmp_path / 'B_edited.tif', array_B)
+
+    comparison = fuzz.FuzzyComparison(*rasters, NEIGH, HALVING_DISTANCE)
+    s_AB, s_BA = comparison.two_way_measures(method)
+    S, _, _ = comparison.update(s_AB, s_BA, edited, changed, method, 'comparison', str(tmp_path), True)
+    with rio.open(str(tmp_path / 'comparison.tif')) as src:
+        S_i = src.read(1)
+
+    reference = compare(rasters[0], edited, tmp_path, method, engine='loop')
+    np.testing.assert_equal(S, reference[0])
+    np.testing.assert_array_equal(S_i, reference[1])
+
+
+def test_memory_map_sidecars_follow_the_raster(tmp_path):
+    array_A, array_B = fixture_arrays()
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    raster_A = write_raster(tmp_path / 'a' / 'map.tif', array_A)
+    raster_B = write_raster(tmp_path / 'b' / 'map.tif', array_B)
+    sidecars = str(tmp_path / 'sidecars')
+    os.mkdir(sidecars)
+    np.testing.assert_array_equal(fuzz.read_raster_mmap(raster_A, sidecars)[0], array_A)
+    np.testing.assert_array_equal(fuzz.read_raster_mmap(raster_B, sidecars)[0], array_B)
+
+    # Rewritten raster, with an older modification time than its sidecar
+    write_raster(raster_A, array_B)
+    os.utime(raster_A, (0, 0))
+    np.testing.assert_array_equal(fuzz.read_raster_mmap(raster_A, sidecars)[0], array_B)
+
+
+@pytest.mark.parametrize('method', METHODS)
+@pytest.mark.parametrize('options', [{'engine': 'vectorized'}, {'engine': 'ring'}, {'tile_size': 8}],
+                         ids=['vectorized', 'ring', 'tiled'])
+def test_float32_maps_match_loop(rasters, loop, tmp_path, method, options):
+    S, S_i = compare(*rasters, tmp_path, method, map_dtype='float32', **options)
+    assert S == pytest.approx(loop[method][0], rel=1e-5, nan_ok=True)
+    np.testing.assert_allclose(S_i, loop[method][1], rtol=1e-5)
+
+
+@pytest.mark.parametrize('method', METHODS)
+@pytest.mark.parametrize('observed', ['A', 'B'])
+def test_random_measure_matches_loop(rasters, nan, tmp_path, method, observed):
+    arrays = list(fixture_arrays(nan=nan))
+    index = 'AB'.index(observed)
+    valid = arrays[index] != NODATA
+    arrays[index][valid] = np.random.default_rng(7).permutation(arrays[index][valid])
+    shuffled = [write_raster(tmp_path / (name + '.tif'), array) for name, array in zip('AB', arrays)]
+
+    comparison = fuzz.FuzzyComparison(*rasters, NEIGH, HALVING_DISTANCE)
+    S = comparison.random_measure(7, method, observed=observed)
+    np.testing.assert_equal(S, compare(*shuffled, tmp_path, method, engine='loop')[0])
+
+
+@pytest.mark.parametrize('method', METHODS)
+@pytest.mark.parametrize('options', [{}, {'workers': 2}, {'tile_size': 8}], ids=['in_memory', 'workers', 'tiled'])
+def test_levels_engine_matches_loop_on_rounded_maps(nan, tmp_path, method, options):
+    # Values on multiples of the tolerance (exact in float32), which the engine leaves as they are
+    arrays = [np.where(array == NODATA, array, np.round(array * 4) / 4) for array in fixture_arrays(nan=nan)]
+    rounded = [write_raster(tmp_path / (name + '.tif'), array) for name, array in zip('AB', arrays)]
+    S, S_i = compare(*rounded, tmp_path, method, engine='levels', tolerance=0.25, **options)
+    reference = compare(*rounded, tmp_path, method, engine='loop')
+    assert S == pytest.approx(reference[0], rel=1e-6, nan_ok=True)
+    np.testing.assert_array_equal(S_i, reference[1])
+
+
+@pytest.mark.parametrize('method', METHODS)
+@pytest.mark.parametrize('neigh, halving_distance, decay', [(4, 2, 'exponential'), (9, 2, 'exponential'),
+                                                            (6, 3, 'linear')])
+@pytest.mark.parametrize('dtype', [float, np.float32])
+def test_levels_reduce_is_shift_reduce_of_the_rounded_neighbours(nan, method, neigh, halving_distance, decay, dtype):
+    array_A, array_B = fixture_arrays(nan=nan)
+    valid_A, valid_B = array_A != NODATA, array_B != NODATA
+    kernel = engines.get_kernel(neigh, halving_distance, decay)
+    tolerance = engines.level_step(array_A, array_B, NODATA)
+    best, found = engines.levels_reduce(array_A, array_B, valid_A, valid_B, kernel, method, tolerance=tolerance,
+                                        dtype=dtype)
+    rounded = np.where(valid_B, np.round(array_B.astype(float) / tolerance) * tolerance, array_B).astype('float32')
+    exact, exact_found = engines.shift_reduce(array_A, rounded, valid_A, valid_B, kernel, method, dtype=dtype)
+    np.testing.assert_array_equal(found, exact_found)
+    np.testing.assert_array_equal(best[found], exact[found])
+
+
+@pytest.mark.parametrize('method', METHODS)
+@pytest.mark.parametrize('workers', [1, 2])
+def test_ring_pruning_is_recorded(rasters, nan, tmp_path, method, workers):
+    comparison = fuzz.FuzzyComparison(*rasters, NEIGH, HALVING_DISTANCE, engine='ring', workers=workers,
+                                      run_record=True)
+    compare_maps = comparison.fuzzy_numerical if method == 'numerical' else comparison.fuzzy_rmse
+    compare_maps('comparison', str(tmp_path))
+    with open(str(tmp_path / 'comparison.json')) as file:
+        pruning = json.load(file)['pruning']
+    # Every offset of every valid cell of both passes is either evaluated or pruned
+    cells = sum(np.count_nonzero(array != NODATA) for array in fixture_arrays(nan=nan))
+    assert pruning['evaluated'] + pruning['pruned'] == cells * (2 * NEIGH + 1) ** 2
+    assert pruning == comparison.pruning
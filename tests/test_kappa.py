@@ -0,0 +1,29 @@
+""" In the crisp case the fuzzy kappa is Cohen's kappa """
+import numpy as np
+import pytest
+
+from fuzzycorr import fuzzycomp as fuzz
+from conftest import NODATA, write_raster
+
+
+def test_crisp_fuzzy_kappa_is_cohens_kappa(tmp_path):
+    rng = np.random.RandomState(1)
+    array_A = rng.randint(1, 13, (40, 35)).astype('int16')
+    array_B = np.where(rng.random_sample(array_A.shape) < 0.6, array_A, rng.randint(1, 13, array_A.shape))
+    array_B = array_B.astype('int16')
+    array_A[rng.random_sample(array_A.shape) < 0.1] = NODATA
+    array_B[:2, :] = NODATA
+
+    comparison = fuzz.FuzzyComparison(write_raster(tmp_path / 'A.tif', array_A),
+                                      write_raster(tmp_path / 'B.tif', array_B), neigh=0, halving_distance=1)
+    K, P, E = comparison.fuzzy_kappa('kappa', str(tmp_path), map_of_comparison=False)
+
+    both = (array_A != NODATA) & (array_B != NODATA)
+    categories = np.union1d(array_A[both], array_B[both])
+    p_A = np.array([np.mean(array_A[both] == c) for c in categories])
+    p_B = np.array([np.mean(array_B[both] == c) for c in categories])
+    p_o = np.mean(array_A[both] == array_B[both])
+    p_e = np.sum(p_A * p_B)
+    assert P == pytest.approx(p_o)
+    assert E == pytest.approx(p_e)
+    assert K == pytest.approx((p_o - p_e) / (1 - p_e))
@@ -0,0 +1,122 @@
+""" Gridding and interpolation of the points (prepro) """
+import numpy as np
+import pytest
+from scipy import interpolate
+
+from fuzzycorr import prepro
+
+
+EXTENT, NROW, NCOL = (0.1, 7.3, -2.2, 3.1), 11, 13
+
+
+def survey_points(points=2000, seed=0):
+    """ Scattered points over EXTENT (some outside of it), plus points on every edge of the cells of the grid
+
+    :return: np.array x, np.array y, np.array z
+    """
+    rng = np.random.RandomState(seed)
+    xmin, xmax, ymin, ymax = EXTENT
+    x = rng.uniform(xmin - 0.5, xmax + 0.5, points)
+    y = rng.uniform(ymin - 0.5, ymax + 0.5, points)
+    # Grid of the edges, as np.histogram2d computes them
+    edge_x, edge_y = np.meshgrid(np.linspace(xmin, xmax, NCOL + 1), np.linspace(ymin, ymax, NROW + 1))
+    x = np.concatenate((x, edge_x.ravel()))
+    y = np.concatenate((y, edge_y.ravel()))
+    return x, y, rng.normal(0, 1, x.size)
+
+
+def sparse_grid(shape=(37, 71), points=300, seed=0):
+    """ Grid masked everywhere but at scattered cells holding values, with an empty band of columns on the right
+
+    :return: np.ma.array (float)
+    """
+    rng = np.random.RandomState(seed)
+    array = np.ma.masked_all(shape)
+    rows, cols = rng.randint(0, shape[0], points), rng.randint(0, shape[1] - 20, points)
+    array[rows, cols] = rng.uniform(-3, 3, points)
+    return array
+
+
+@pytest.mark.parametrize('method', ['idw', 'natural'])
+def test_local_interpolation_keeps_the_data(method):
+    array = sparse_grid()
+    out = prepro.local_interpolation(array, method, radius=6.5)
+    valid = ~np.ma.getmaskarray(array)
+    np.testing.assert_array_equal(out[valid], array[valid])
+
+
+@pytest.mark.parametrize('method', prepro.LOCAL_METHODS)
+def test_local_interpolation_fills_beyond_radius(method):
+    array = sparse_grid()
+    radius = 4.5
+    out = prepro.local_interpolation(array, method, radius=radius, fill_value=-9999)
+    yy, xx = np.indices(array.shape)
+    rows, cols = np.nonzero(~np.ma.getmaskarray(array))
+    distance = np.hypot(yy[..., None] - rows, xx[..., None] - cols).min(axis=-1)
+    assert np.any(distance > radius)
+    np.testing.assert_array_equal(out == -9999, distance > radius)
+
+
+@pytest.mark.parametrize('method', prepro.LOCAL_METHODS)
+@pytest.mark.parametrize('options', [{'workers': 2}, {'block_rows': 5}, {'block_rows': 5, 'workers': 2}],
+                         ids=['workers', 'blocks', 'blocks-workers'])
+def test_local_interpolation_blocks_match_serial(method, options):
+    array = sparse_grid()
+    serial = prepro.local_interpolation(array, method, radius=6.5)
+    np.testing.assert_array_equal(prepro.local_interpolation(array, method, radius=6.5, **options), serial)
+
+
+def test_grid_points_match_histogram2d():
+    x, y, z = survey_points()
+    xmin, xmax, ymin, ymax = EXTENT
+    # Mean and count of each cell as the gridding computed them with np.histogram2d, first row at ymax
+    hrange = ((ymin, ymax), (xmin, xmax))
+    sums = np.histogram2d(y, x, bins=(NROW, NCOL), range=hrange, weights=z)[0]
+    counts = np.histogram2d(y, x, bins=(NROW, NCOL), range=hrange)[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.flipud(sums / counts)
+    count = np.flipud(np.where(counts > 0, counts, np.nan))
+
+    np.testing.assert_allclose(prepro.grid_points(x, y, z, EXTENT, NROW, NCOL), mean, rtol=1e-12)
+    np.testing.assert_array_equal(prepro.grid_points(x, y, z, EXTENT, NROW, NCOL, 'count'), count)
+
+
+@pytest.mark.parametrize('aggregate', ['mean', 'count', 'std', 'min', 'max'])
+def test_grid_accumulator_chunks_match_grid_points(aggregate):
+    x, y, z = survey_points()
+    accumulator = prepro.GridAccumulator(EXTENT, NROW, NCOL, aggregates=('std', 'min', 'max'))
+    # Uneven chunks, one of them empty
+    for start, stop in zip([0, 7, 7, 500, 1300], [7, 7, 500, 1300, x.size]):
+        accumulator.add(x[start:stop], y[start:stop], z[start:stop])
+    np.testing.assert_allclose(accumulator.grid(aggregate), prepro.grid_points(x, y, z, EXTENT, NROW, NCOL, aggregate),
+                               rtol=1e-10)
+
+
+def test_grid_accumulator_rejects_the_median():
+    with pytest.raises(ValueError):
+        prepro.GridAccumulator(EXTENT, NROW, NCOL, aggregates=('median',))
+
+
+@pytest.mark.parametrize('method', ['linear', 'cubic', 'nearest'])
+def test_grid_interpolator_matches_griddata(method):
+    valid = ~np.ma.getmaskarray(sparse_grid())
+    rows, cols = np.nonzero(valid)
+    yy, xx = np.indices(valid.shape)
+    interpolator = prepro.get_interpolator(valid)
+    # The triangulation and weights built for the first values serve the next ones
+    for seed in (1, 2):
+        values = np.random.RandomState(seed).uniform(-3, 3, rows.size)
+        expected = interpolate.griddata((cols, rows), values, (xx, yy), method=method)
+        np.testing.assert_allclose(interpolator(values, method).reshape(valid.shape), expected, rtol=1e-10,
+                                   atol=1e-12)
+
+
+def test_get_interpolator_keeps_the_recent_layouts():
+    prepro.clear_interpolators()
+    layouts = [~np.ma.getmaskarray(sparse_grid(seed=seed)) for seed in range(prepro.INTERPOLATORS + 1)]
+    first = prepro.get_interpolator(layouts[0])
+    assert prepro.get_interpolator(layouts[0].copy()) is first
+    for valid in layouts[1:]:
+        prepro.get_interpolator(valid)
+    assert prepro.get_interpolator(layouts[0]) is not first  # least recently used, released
+    assert prepro.clear_interpolators() == prepro.INTERPOLATORS